@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Dish, Tag, Ingredient, IngredientPosition, Meal, MealPosition
+from .search import filter_dishes
 
 
 class TagInline(admin.TabularInline):
@@ -16,6 +17,12 @@ class IngredientPositionInline(admin.TabularInline):
 @admin.register(Dish)
 class DishAdmin(admin.ModelAdmin):
     inlines = (TagInline, IngredientPositionInline)
+    search_fields = ('name',)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return filter_dishes(queryset, search_term), False
 
 
 @admin.register(Tag)
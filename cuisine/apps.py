@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CuisineConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cuisine'
+
+    def ready(self):
+        from cuisine import signals  # noqa: F401
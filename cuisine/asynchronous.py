@@ -0,0 +1,47 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from cuisine.instrumentation import instrument_connections
+
+T = TypeVar('T')
+
+_threads_count = settings.ASYNC_THREADS
+_executor = ThreadPoolExecutor(max_workers=_threads_count, thread_name_prefix='cuisine-async')
+
+
+def _call_in_worker(func: Callable[..., T], *args, **kwargs) -> T:
+    # worker threads outlive requests, so their connections are checked the way Django does it per request
+    close_old_connections()
+    try:
+        with instrument_connections():
+            return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_thread_pool(func: Callable[..., T], *args, **kwargs) -> T:
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        _executor, functools.partial(context.run, _call_in_worker, func, *args, **kwargs),
+    )
+
+
+def _close_connections(barrier: threading.Barrier) -> None:
+    # every task waits for the others, so each thread of the pool runs exactly one of them
+    barrier.wait()
+    connections.close_all()
+
+
+def close_thread_pool_connections() -> None:
+    """Закрывает соединения с базой во всех потоках пула, которые иначе живут CONN_MAX_AGE секунд."""
+    barrier = threading.Barrier(_threads_count)
+    for future in [_executor.submit(_close_connections, barrier) for _ in range(_threads_count)]:
+        future.result()
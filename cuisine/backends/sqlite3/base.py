@@ -0,0 +1,22 @@
+import django
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+# Django 3.2 has no option for the BEGIN mode (OPTIONS['transaction_mode'] came in 5.1), so the private method
+# that opens atomic() blocks is overridden. Check it against the new version before upgrading
+if django.VERSION[:2] != (3, 2):
+    raise ImproperlyConfigured('cuisine.backends.sqlite3 overrides private methods of the Django 3.2 backend')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # set by cuisine.transactions.write_transaction for the block it opens
+    immediate_transaction = False
+
+    def _start_transaction_under_autocommit(self):
+        # a deferred transaction that reads first can't wait for the write lock and fails with
+        # "database is locked", so write transactions take it at BEGIN, while read-only ones stay deferred
+        if self.immediate_transaction:
+            self.cursor().execute(f'BEGIN {settings.SQLITE_TRANSACTION_MODE}')
+        else:
+            super()._start_transaction_under_autocommit()
@@ -0,0 +1,166 @@
+import datetime
+import json
+import random
+from typing import List
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+
+from cuisine.dish_costs import rebuild_dish_cost_summaries
+from cuisine.signals import reset_catalog_caches
+from cuisine.models import Dish, Tag, Ingredient, IngredientPosition, Meal, MealPosition
+
+UNITS = ('г', 'мл', 'штука', 'ст л', 'ч л')
+
+
+def _next_id(model) -> int:
+    return (model.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+
+
+@transaction.atomic
+def build_catalog(
+        dishes_count: int,
+        ingredients_count: int,
+        tags_count: int = 0,
+        ingredients_per_dish: int = 8,
+        batch_size: int = 1000,
+        seed: int = 0,
+) -> List[int]:
+    randomizer = random.Random(seed)
+
+    first_tag_id = _next_id(Tag)
+    meal_type_tags = [name for _, name in Meal.MEAL_TYPES]
+    extra_tags = [f'тэг {number}' for number in range(tags_count)]
+    tags = [
+        Tag(id=first_tag_id + number, name=name)
+        for number, name in enumerate(meal_type_tags + extra_tags)
+    ]
+    Tag.objects.bulk_create(tags, batch_size=batch_size)
+
+    first_ingredient_id = _next_id(Ingredient)
+    ingredients = [
+        Ingredient(
+            id=first_ingredient_id + number,
+            name=f'ингредиент {number}',
+            price=randomizer.randint(20, 2000),
+            units=randomizer.choice(UNITS),
+        )
+        for number in range(ingredients_count)
+    ]
+    Ingredient.objects.bulk_create(ingredients, batch_size=batch_size)
+
+    first_dish_id = _next_id(Dish)
+    dishes = [
+        Dish(
+            id=first_dish_id + number,
+            name=f'блюдо {number}',
+            recipe='Смешать и подать.\n' * 5,
+            cooking_time='30 минут',
+            image='images/benchmark.jpg',
+        )
+        for number in range(dishes_count)
+    ]
+    Dish.objects.bulk_create(dishes, batch_size=batch_size)
+
+    dish_tags = []
+    positions = []
+    ingredients_per_dish = min(ingredients_per_dish, ingredients_count)
+    for dish in dishes:
+        meal_type_tag = tags[dish.id % len(meal_type_tags)]
+        dish_tags.append(Tag.dishes.through(tag_id=meal_type_tag.id, dish_id=dish.id))
+        if extra_tags:
+            extra_tag = randomizer.choice(tags[len(meal_type_tags):])
+            dish_tags.append(Tag.dishes.through(tag_id=extra_tag.id, dish_id=dish.id))
+
+        for ingredient in randomizer.sample(ingredients, k=ingredients_per_dish):
+            positions.append(IngredientPosition(
+                dish_id=dish.id,
+                ingredient_id=ingredient.id,
+                quantity=randomizer.randint(1, 500) if ingredient.units in ('г', 'мл') else randomizer.randint(1, 4),
+            ))
+    Tag.dishes.through.objects.bulk_create(dish_tags, batch_size=batch_size)
+    IngredientPosition.objects.bulk_create(positions, batch_size=batch_size)
+
+    rebuild_dish_cost_summaries(batch_size=batch_size)
+    # bulk inserts don't send the signals that reset the in-process caches, and the benchmarks may run inside
+    # a transaction that is never committed, so the caches are reset right away
+    reset_catalog_caches()
+    return [dish.id for dish in dishes]
+
+
+@transaction.atomic
+def build_users_with_meals(
+        users_count: int,
+        weeks_count: int,
+        dish_ids: List[int],
+        batch_size: int = 1000,
+        seed: int = 0,
+) -> List[User]:
+    randomizer = random.Random(seed)
+
+    first_user_id = _next_id(User)
+    users = [
+        User(id=first_user_id + number, username=f'benchmark_{first_user_id + number}', password='!')
+        for number in range(users_count)
+    ]
+    User.objects.bulk_create(users, batch_size=batch_size)
+
+    today = datetime.date.today()
+    dates = [today - datetime.timedelta(days=day) for day in range(1, weeks_count * 7 + 1)]
+
+    first_meal_id = _next_id(Meal)
+    meals = []
+    meal_positions = []
+    for user in users:
+        for date in dates:
+            for meal_type, _ in Meal.MEAL_TYPES:
+                meal = Meal(id=first_meal_id + len(meals), meal_type=meal_type, date=date, customer_id=user.id)
+                meals.append(meal)
+                meal_positions.append(MealPosition(meal_id=meal.id, dish_id=randomizer.choice(dish_ids), quantity=1))
+    Meal.objects.bulk_create(meals, batch_size=batch_size)
+    MealPosition.objects.bulk_create(meal_positions, batch_size=batch_size)
+    return users
+
+
+QUANTITIES = ('300 г', '2 штуки', '1/2 чайной ложки', '1 1/2 стакана', '1,5 л', '0.5 кг', '3 столовые ложки', 'по вкусу')
+
+
+def build_recipe_page(number: int, randomizer: random.Random) -> str:
+    """Страница рецепта с разметкой eda.ru: нужные parse_recipe узлы среди меню, подборок и данных Next.js."""
+    ingredients = randomizer.sample(range(300), k=8)
+    ingredient_rows = ''.join(
+        f'<div class="emotion-7yevpr"><span class="css-12s4kyf-Info">ингредиент {ingredient}</span>'
+        f'<span class="css-1t5teuh-Info">{randomizer.choice(QUANTITIES)}</span></div>'
+        for ingredient in ingredients
+    )
+    steps = ''.join(
+        f'<div class="emotion-1d0ue5h"><span class="emotion-bzb65q">{step}</span>'
+        f'<span class="css-8repvw-Info">Шаг {step} рецепта {number}:&nbsp;нарезать, смешать и подать.</span></div>'
+        for step in range(1, 7)
+    )
+    cards = ''.join(
+        f'<div class="emotion-1eugp2w"><a href="/recepty/{number + card}"><div class="emotion-1j5xcrd">'
+        f'<picture><source srcset="/img/{card}.webp" type="image/webp"><img src="/img/{card}.jpg" alt=""></picture>'
+        f'</div><span class="emotion-1bs2jj2">Похожее блюдо {card}</span><span class="emotion-tqfyce">'
+        f'<svg viewBox="0 0 24 24"><path d="M12 2 L22 22 L2 22 Z"></path></svg>{card % 90} мин</span></a></div>'
+        for card in range(60)
+    )
+    menu = ''.join(f'<li class="emotion-1x7xvk"><a href="/recepty/{item}">Раздел {item}</a></li>' for item in range(80))
+    next_data = json.dumps(
+        {'props': {'pageProps': {'recipes': [{'id': card, 'name': f'блюдо {card}'} for card in range(1500)]}}},
+        ensure_ascii=False,
+    )
+    return (
+        f'<!DOCTYPE html><html lang="ru"><head><meta charset="utf-8"><title>Блюдо {number}</title>'
+        f'<style>{".emotion-a{display:flex}" * 500}</style></head><body><div id="__next">'
+        f'<header><nav><ul>{menu}</ul></nav></header><main>'
+        f'<div class="css-17zastc"><div class="css-3uhzwz-ImageBase"><img src="https://eda.ru/img/{number}.jpg"></div></div>'
+        f'<h1 class="emotion-gl52ge">Блюдо&nbsp;{number}</h1>'
+        f'<ul class="css-a90bfp"><li><a href="/recepty/supy">Супы</a></li><li><a href="/recepty/obed">обед</a></li></ul>'
+        f'<div class="css-1k7lmq6"><span>Порций</span><span>{randomizer.randint(1, 6)}</span>'
+        f'<span>Время</span><span>{randomizer.randint(10, 120)} минут</span></div>'
+        f'<div class="emotion-ij8fsb">{ingredient_rows}</div><div class="emotion-1ywwzp6">{steps}</div>'
+        f'<section>{cards}</section></main><footer><ul>{menu}</ul></footer></div>'
+        f'<script id="__NEXT_DATA__" type="application/json">{next_data}</script></body></html>'
+    )
@@ -0,0 +1,59 @@
+import statistics
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    wall_time_ms: float
+    queries_count: int
+    peak_memory_kb: float
+    query_budget: Optional[int] = None
+
+    @property
+    def over_budget(self) -> bool:
+        return self.query_budget is not None and self.queries_count > self.query_budget
+
+    def __str__(self):
+        budget = '-' if self.query_budget is None else self.query_budget
+        return (
+            f'{self.name:<45} {self.wall_time_ms:>10.2f} ms {self.queries_count:>6} queries '
+            f'(budget {budget}) {self.peak_memory_kb:>10.1f} KiB'
+        )
+
+
+def measure(
+        name: str,
+        func: Callable[[], object],
+        repeat: int = 5,
+        query_budget: Optional[int] = None,
+) -> BenchmarkResult:
+    func()
+
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started_at) * 1000)
+
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return BenchmarkResult(
+        name=name,
+        wall_time_ms=statistics.median(timings),
+        queries_count=len(queries.captured_queries),
+        peak_memory_kb=peak_memory / 1024,
+        query_budget=query_budget,
+    )
@@ -0,0 +1,168 @@
+import asyncio
+import statistics
+import threading
+import time
+from dataclasses import dataclass, field
+from itertools import cycle, islice
+from typing import Callable, List, Optional, Sequence
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.db import DatabaseError, close_old_connections, connections
+from django.test import AsyncClient, Client
+
+from cuisine.asynchronous import close_thread_pool_connections
+
+
+@dataclass
+class LoadResult:
+    name: str
+    clients_count: int
+    elapsed: float
+    latencies: List[float] = field(default_factory=list)
+    errors_count: int = 0
+    latency_budget_ms: Optional[float] = None
+
+    @property
+    def over_budget(self) -> bool:
+        # a run without successful requests can't show its latency, so it fails the budget
+        if self.latency_budget_ms is None:
+            return False
+        return not self.latencies or self.get_percentile(99) > self.latency_budget_ms
+
+    @property
+    def throughput(self) -> float:
+        return len(self.latencies) / self.elapsed
+
+    def get_percentile(self, percentile: int) -> float:
+        return statistics.quantiles(self.latencies, n=100, method='inclusive')[percentile - 1] * 1000
+
+    def __str__(self):
+        return (
+            f'{self.name:<45} {self.clients_count:>3} clients {self.throughput:>8.1f} req/s '
+            f'p50 {self.get_percentile(50):>7.2f} ms p99 {self.get_percentile(99):>7.2f} ms '
+            f'{self.errors_count} errors'
+        )
+
+
+def _make_client(client_class, user: Optional[User]):
+    client = client_class()
+    if user is not None:
+        client.force_login(user)
+    return client
+
+
+def run_wsgi_load(
+        name: str,
+        paths: Sequence[str],
+        clients_count: int,
+        requests_count: int,
+        user: Optional[User] = None,
+        latency_budget_ms: Optional[float] = None,
+) -> LoadResult:
+    # every client gets its own thread, like a threaded WSGI server
+    clients = [_make_client(Client, user) for _ in range(clients_count)]
+    result = LoadResult(name=name, clients_count=clients_count, elapsed=0, latency_budget_ms=latency_budget_ms)
+    lock = threading.Lock()
+
+    def run_client(client):
+        latencies = []
+        errors_count = 0
+        try:
+            for number in range(requests_count):
+                started_at = time.perf_counter()
+                response = client.get(paths[number % len(paths)])
+                latencies.append(time.perf_counter() - started_at)
+                errors_count += response.status_code >= 400
+        finally:
+            connections.close_all()
+        with lock:
+            result.latencies.extend(latencies)
+            result.errors_count += errors_count
+
+    threads = [threading.Thread(target=run_client, args=(client,)) for client in clients]
+    started_at = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.elapsed = time.perf_counter() - started_at
+    return result
+
+
+def run_asgi_load(
+        name: str,
+        paths: Sequence[str],
+        clients_count: int,
+        requests_count: int,
+        user: Optional[User] = None,
+        latency_budget_ms: Optional[float] = None,
+) -> LoadResult:
+    # all clients share one event loop, like a single ASGI server process
+    clients = [_make_client(AsyncClient, user) for _ in range(clients_count)]
+    result = LoadResult(name=name, clients_count=clients_count, elapsed=0, latency_budget_ms=latency_budget_ms)
+
+    async def run_client(client):
+        for number in range(requests_count):
+            started_at = time.perf_counter()
+            response = await client.get(paths[number % len(paths)])
+            result.latencies.append(time.perf_counter() - started_at)
+            result.errors_count += response.status_code >= 400
+
+    async def run_clients():
+        await asyncio.gather(*(run_client(client) for client in clients))
+
+    started_at = time.perf_counter()
+    asyncio.run(run_clients())
+    result.elapsed = time.perf_counter() - started_at
+    # sync views run in asgiref's thread and async ones in cuisine's pool, both keep their connections open
+    # for CONN_MAX_AGE, which would block the journal mode switch of the contention suite
+    asyncio.run(sync_to_async(connections.close_all)())
+    close_thread_pool_connections()
+    return result
+
+
+def run_parallel_calls(
+        name: str,
+        func: Callable[[object], object],
+        arguments: Sequence[object],
+        workers_count: int,
+        latency_budget_ms: Optional[float] = None,
+) -> LoadResult:
+    # every call is handled like a request: connections are closed or kept after it according to CONN_MAX_AGE
+    result = LoadResult(name=name, clients_count=workers_count, elapsed=0, latency_budget_ms=latency_budget_ms)
+    lock = threading.Lock()
+
+    def run_worker(worker_arguments):
+        latencies = []
+        errors_count = 0
+        try:
+            for argument in worker_arguments:
+                started_at = time.perf_counter()
+                try:
+                    func(argument)
+                except DatabaseError:
+                    errors_count += 1
+                else:
+                    latencies.append(time.perf_counter() - started_at)
+                close_old_connections()
+        finally:
+            connections.close_all()
+        with lock:
+            result.latencies.extend(latencies)
+            result.errors_count += errors_count
+
+    # with fewer arguments than workers they are reused, so every worker makes calls and the reported number
+    # of clients is the number that ran at the same time
+    calls = list(islice(cycle(arguments), max(len(arguments), workers_count)))
+    threads = [
+        threading.Thread(target=run_worker, args=(calls[number::workers_count],))
+        for number in range(workers_count)
+    ]
+    started_at = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.elapsed = time.perf_counter() - started_at
+    return result
@@ -0,0 +1,497 @@
+import glob
+import os
+import random
+from contextlib import contextmanager
+from types import ModuleType
+from typing import List
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, F, FloatField, Q
+from django.db.models.functions import Cast
+from django.test import Client, override_settings
+from django.urls import path, reverse
+
+from cuisine.benchmarks.fixtures import build_catalog, build_recipe_page, build_users_with_meals
+from cuisine.benchmarks.harness import BenchmarkResult, measure
+from cuisine.benchmarks.load import LoadResult, run_asgi_load, run_parallel_calls, run_wsgi_load
+from cuisine.ingredient_index import get_ingredient_index, load_ingredient_index
+from cuisine.ingredient_matrix import is_ingredient_matrix_available, load_ingredient_matrix
+from cuisine.models import Dish, Ingredient, IngredientPosition, Meal, MealPosition
+from cuisine.planner import MenuPlanner, load_dish_catalog
+from cuisine.quantities import normalize_units, parse_quantities, parse_quantity
+from cuisine.recipe_parsing import PARSER_BACKENDS, parse_recipe_html
+from cuisine.search import DishSearchResults, rebuild_search_index
+from cuisine.snapshots import SNAPSHOT_INDEX, SnapshotStore, read_snapshot
+from cuisine.views import pure_bootstrap, pure_bootstrap_async
+from cuisine.views.pure_bootstrap import PANTRY_DISHES_COUNT, SEARCH_PAGE_SIZE
+from foodplan import urls
+from cuisine.services import (
+    generate_dates_from_today,
+    generate_daily_menu_randomly,
+    regenerate_and_save_menu,
+    aggregate_ingredients,
+    aggregate_ingredients_in_db,
+    aggregate_ingredients_from_summaries,
+    aggregate_ingredients_from_matrix,
+)
+
+MIGRATION_BEFORE_INDEXES = '0009_dishcostsummary'
+
+# Authenticated views spend two queries on the session and the user, transactions add a BEGIN
+QUERY_BUDGETS = {
+    'view index': 1,
+    'view week_menu': 7,
+    'view calculator': 5,
+    'view recipe': 3,
+    'service regenerate_and_save_menu': 2,
+    'service generate_daily_menu_randomly': 1,
+    'service aggregate_ingredients': 1,
+    'service aggregate_ingredients_in_db': 1,
+    'service aggregate_ingredients_from_summaries': 3,
+    'service aggregate_ingredients_from_matrix': 1,
+    'ingredient matrix load': 3,
+    'search fts': 2,
+    'search icontains': 1,
+    'view search': 3,
+    'ingredient index load': 1,
+    'ingredient index find_dishes': 0,
+    'pantry orm': 1,
+    'view pantry': 2,
+    'planner load_dish_catalog': 4,
+    'planner plan': 0,
+}
+
+PLANNER_MAX_WEEKLY_COST = 150000
+LOAD_CLIENTS_COUNTS = (1, 8, 32)
+CONTENTION_WORKERS_COUNTS = (1, 4, 16)
+
+# SQLite defaults are the rollback journal, full sync, deferred transactions and the 5 s timeout of the sqlite3 module
+DATABASE_PROFILES = {
+    'sqlite': {
+        'defaults': {
+            'CONN_MAX_AGE': 0,
+            'SQLITE_PRAGMAS': {'journal_mode': 'delete', 'synchronous': 'full', 'busy_timeout': 5000},
+            'SQLITE_TRANSACTION_MODE': 'DEFERRED',
+        },
+        'tuned': {
+            'CONN_MAX_AGE': 60,
+            'SQLITE_PRAGMAS': {'journal_mode': 'wal', 'synchronous': 'normal', 'busy_timeout': 5000},
+            'SQLITE_TRANSACTION_MODE': 'IMMEDIATE',
+        },
+    },
+    'postgresql': {
+        'per-request connections': {'CONN_MAX_AGE': 0},
+        'persistent connections': {'CONN_MAX_AGE': 600},
+    },
+}
+
+
+def build_dataset(options):
+    dish_ids = build_catalog(
+        dishes_count=options['dishes'],
+        ingredients_count=options['ingredients'],
+        tags_count=options['tags'],
+        ingredients_per_dish=options['ingredients_per_dish'],
+    )
+    users = build_users_with_meals(options['users'], options['weeks'], dish_ids)
+    return dish_ids, users
+
+
+def run_views_suite(options, log) -> List[BenchmarkResult]:
+    dish_ids, (user, *_) = build_dataset(options)
+    regenerate_and_save_menu(user)
+    weekdays = generate_dates_from_today(days_count=7)
+
+    anonymous_client = Client()
+    client = Client()
+    client.force_login(user)
+
+    benchmarks = {
+        'view index': lambda: anonymous_client.get(reverse('index')),
+        'view week_menu': lambda: client.get(reverse('week_menu')),
+        'view calculator': lambda: client.post(reverse('calculator'), {'days': 7}),
+        'view recipe': lambda: anonymous_client.get(reverse('recipe', args=[dish_ids[0]])),
+        'service regenerate_and_save_menu': lambda: regenerate_and_save_menu(user),
+        'service generate_daily_menu_randomly': generate_daily_menu_randomly,
+        'service aggregate_ingredients': lambda: aggregate_ingredients(user, weekdays),
+        'service aggregate_ingredients_in_db': lambda: aggregate_ingredients_in_db(user, weekdays),
+        'service aggregate_ingredients_from_summaries': lambda: aggregate_ingredients_from_summaries(user, weekdays),
+        'service aggregate_ingredients_from_matrix': lambda: aggregate_ingredients_from_matrix(user, weekdays),
+    }
+    return [
+        measure(name, func, repeat=options['repeat'], query_budget=QUERY_BUDGETS.get(name))
+        for name, func in benchmarks.items()
+    ]
+
+
+def run_indexes_suite(options, log) -> List[BenchmarkResult]:
+    dish_ids, users = build_dataset(options)
+    user = users[len(users) // 2]
+    for user_to_plan in users:
+        regenerate_and_save_menu(user_to_plan)
+    weekdays = generate_dates_from_today(days_count=7)
+    planned_dish_ids = list(
+        MealPosition.objects.filter(meal__customer=user, meal__date__in=weekdays).values_list('dish_id', flat=True)
+    )
+
+    queries = {
+        'meal slots of user': Meal.objects.filter(customer=user, date__in=weekdays).values_list('date', 'meal_type'),
+        'week meals of user': Meal.objects.filter(customer=user, date__in=weekdays).order_by('date'),
+        'dishes by tag name': Dish.objects.filter(tags__name='обед').values_list('id', flat=True),
+        'ingredients of dishes': (
+            IngredientPosition.objects.filter(dish_id__in=planned_dish_ids).values_list('ingredient_id', 'quantity')
+        ),
+    }
+
+    def explain_queries(label):
+        results = []
+        for name, queryset in queries.items():
+            log(f'EXPLAIN {name} ({label}):')
+            log(queryset.explain())
+            results.append(measure(f'{name} ({label})', lambda: list(queryset.all()), repeat=options['repeat']))
+        return results
+
+    results = explain_queries('with indexes')
+    call_command('migrate', 'cuisine', MIGRATION_BEFORE_INDEXES, verbosity=0)
+    try:
+        results.extend(explain_queries('without indexes'))
+    finally:
+        call_command('migrate', 'cuisine', verbosity=0)
+    return results
+
+
+def run_planner_suite(options, log) -> List[BenchmarkResult]:
+    dish_ids, (user, *_) = build_dataset(options)
+    catalog = load_dish_catalog()
+    planner = MenuPlanner(catalog, max_weekly_cost=PLANNER_MAX_WEEKLY_COST, randomizer=random.Random(0))
+    weekdays = generate_dates_from_today(days_count=7)
+    slots = [(date, meal_type) for date in weekdays for meal_type, _ in Meal.MEAL_TYPES]
+    eaten_dishes = list(
+        MealPosition.objects.filter(meal__customer=user).values_list('meal__date', 'dish_id')
+    )
+    budget = planner.get_budget(len(weekdays), planned_dish_ids=[])
+
+    def describe(label, planned_dish_ids):
+        cost = sum(catalog.get_cost(dish_id) for dish_id in planned_dish_ids)
+        ingredients = set().union(*(catalog.get_ingredients(dish_id) for dish_id in planned_dish_ids))
+        log(f'{label}: cost {cost:.0f}, {len(ingredients)} ingredients, {len(set(planned_dish_ids))} dishes')
+
+    randomizer = random.Random(0)
+    describe('random menu', [randomizer.choice(catalog.dish_ids[meal_type]) for _, meal_type in slots])
+    describe('planned menu', list(planner.plan(slots, eaten_dishes, budget).values()))
+
+    benchmarks = {
+        'planner load_dish_catalog': load_dish_catalog,
+        'planner plan': lambda: planner.plan(slots, eaten_dishes, budget),
+    }
+    return [
+        measure(name, func, repeat=options['repeat'], query_budget=QUERY_BUDGETS.get(name))
+        for name, func in benchmarks.items()
+    ]
+
+
+def run_shopping_list_suite(options, log) -> List[BenchmarkResult]:
+    if not is_ingredient_matrix_available():
+        log('numpy is not installed, the ingredient matrix falls back to cost summaries')
+    _, (user, *_) = build_dataset(options)
+    regenerate_and_save_menu(user)
+    periods = {
+        'week': generate_dates_from_today(days_count=7),
+        'history': [date for date, in Meal.objects.filter(customer=user).values_list('date').distinct()],
+    }
+
+    benchmarks = {}
+    if is_ingredient_matrix_available():
+        benchmarks['ingredient matrix load'] = load_ingredient_matrix
+    for period, weekdays in periods.items():
+        benchmarks.update({
+            f'{name} ({period})': lambda func=func, weekdays=weekdays: func(user, weekdays)
+            for name, func in (
+                ('service aggregate_ingredients', aggregate_ingredients),
+                ('service aggregate_ingredients_from_summaries', aggregate_ingredients_from_summaries),
+                ('service aggregate_ingredients_from_matrix', aggregate_ingredients_from_matrix),
+            )
+        })
+
+        totals = {
+            name: sum(ingredient['total_price'] for ingredient in func(user, weekdays))
+            for name, func in (
+                ('loops', aggregate_ingredients),
+                ('matrix', aggregate_ingredients_from_matrix),
+            )
+        }
+        log(f'{period} total price: ' + ', '.join(f'{name} {total:.2f}' for name, total in totals.items()))
+
+    return [
+        measure(name, func, repeat=options['repeat'], query_budget=QUERY_BUDGETS.get(name.split(' (')[0]))
+        for name, func in benchmarks.items()
+    ]
+
+
+def build_urlconf(views_module):
+    views = {
+        'index': views_module.index_page,
+        'week_menu': views_module.show_next_week_menu,
+        'recipe': views_module.view_recipe,
+    }
+    urlconf = ModuleType(f'{views_module.__name__}_urls')
+    urlconf.urlpatterns = [
+        path(str(pattern.pattern), views[pattern.name], name=pattern.name)
+        if getattr(pattern, 'name', None) in views else pattern
+        for pattern in urls.urlpatterns
+    ]
+    return urlconf
+
+
+def run_load_suite(options, log) -> List[LoadResult]:
+    dish_ids, (user, *_) = build_dataset(options)
+    regenerate_and_save_menu(user)
+    view_paths = {
+        'index': ([reverse('index')], None),
+        'week_menu': ([reverse('week_menu')], user),
+        'recipe': ([reverse('recipe', args=[dish_id]) for dish_id in dish_ids[:100]], None),
+    }
+    modes = {
+        'wsgi': (run_wsgi_load, pure_bootstrap),
+        'asgi sync views': (run_asgi_load, pure_bootstrap),
+        'asgi async views': (run_asgi_load, pure_bootstrap_async),
+    }
+
+    results = []
+    for view_name, (paths, view_user) in view_paths.items():
+        for mode, (run_load, views_module) in modes.items():
+            with override_settings(ROOT_URLCONF=build_urlconf(views_module)):
+                for clients_count in LOAD_CLIENTS_COUNTS:
+                    results.append(run_load(
+                        f'{view_name} ({mode})',
+                        paths,
+                        clients_count=clients_count,
+                        requests_count=options['requests'],
+                        user=view_user,
+                    ))
+    return results
+
+
+@contextmanager
+def use_database_profile(profile):
+    # connections of all threads share the settings dict, so the profile applies to new connections everywhere
+    old_conn_max_age = connection.settings_dict['CONN_MAX_AGE']
+    connection.settings_dict['CONN_MAX_AGE'] = profile['CONN_MAX_AGE']
+    connection.close()
+    try:
+        with override_settings(
+                SQLITE_PRAGMAS=profile.get('SQLITE_PRAGMAS', settings.SQLITE_PRAGMAS),
+                SQLITE_TRANSACTION_MODE=profile.get('SQLITE_TRANSACTION_MODE', settings.SQLITE_TRANSACTION_MODE),
+        ):
+            # the journal mode can only be switched while no other connection is open
+            connection.ensure_connection()
+            yield
+    finally:
+        connection.settings_dict['CONN_MAX_AGE'] = old_conn_max_age
+        connection.close()
+
+
+def run_contention_suite(options, log) -> List[LoadResult]:
+    _, users = build_dataset(options)
+    dates = generate_dates_from_today(days_count=7)
+
+    results = []
+    for profile_name, profile in DATABASE_PROFILES[connection.vendor].items():
+        with use_database_profile(profile):
+            for workers_count in CONTENTION_WORKERS_COUNTS:
+                Meal.objects.filter(date__in=dates).delete()
+                results.append(run_parallel_calls(
+                    f'regenerate_and_save_menu ({profile_name})',
+                    regenerate_and_save_menu,
+                    users,
+                    workers_count=workers_count,
+                ))
+    return results
+
+
+SEARCH_QUERIES = ('блюдо 123', 'ингредиент 7', 'смешать')
+
+
+def run_search_suite(options, log) -> List[BenchmarkResult]:
+    build_catalog(
+        dishes_count=options['dishes'],
+        ingredients_count=options['ingredients'],
+        ingredients_per_dish=options['ingredients_per_dish'],
+    )
+    results = [measure('search rebuild_search_index', rebuild_search_index, repeat=1)]
+
+    client = Client()
+    for query in SEARCH_QUERIES:
+        def search_icontains(query=query):
+            dishes = Dish.objects.filter(
+                Q(name__icontains=query) | Q(recipe__icontains=query) | Q(positions__ingredient__name__icontains=query)
+            ).distinct()
+            return list(dishes[:SEARCH_PAGE_SIZE])
+
+        benchmarks = {
+            'search fts': lambda query=query: DishSearchResults(query)[0:SEARCH_PAGE_SIZE],
+            'search icontains': search_icontains,
+            'view search': lambda query=query: client.get(reverse('search'), {'q': query}),
+        }
+        log(f'{query}: {DishSearchResults(query).count()} dishes found')
+        results.extend(
+            measure(f'{name} ({query})', func, repeat=options['repeat'], query_budget=QUERY_BUDGETS.get(name))
+            for name, func in benchmarks.items()
+        )
+    return results
+
+
+PANTRY_SIZES = (5, 20, 50)
+
+
+def run_pantry_suite(options, log) -> List[BenchmarkResult]:
+    build_catalog(
+        dishes_count=options['dishes'],
+        ingredients_count=options['ingredients'],
+        ingredients_per_dish=options['ingredients_per_dish'],
+    )
+    name = 'ingredient index load'
+    results = [measure(name, load_ingredient_index, repeat=1, query_budget=QUERY_BUDGETS.get(name))]
+
+    ingredient_index = get_ingredient_index()
+    all_ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+    randomizer = random.Random(0)
+    client = Client()
+    for pantry_size in PANTRY_SIZES:
+        ingredient_ids = randomizer.sample(all_ingredient_ids, k=min(pantry_size, len(all_ingredient_ids)))
+
+        def find_dishes_in_db(ingredient_ids=ingredient_ids):
+            dishes = Dish.objects.annotate(
+                covered_count=Count('positions', filter=Q(positions__ingredient_id__in=ingredient_ids)),
+                positions_count=Count('positions'),
+            ).filter(covered_count__gt=0).annotate(
+                coverage=Cast('covered_count', FloatField()) / F('positions_count'),
+            ).order_by('-coverage', '-covered_count', 'id').values_list('id', 'covered_count', 'positions_count')
+            return list(dishes[:PANTRY_DISHES_COUNT])
+
+        benchmarks = {
+            'ingredient index find_dishes': lambda ingredient_ids=ingredient_ids: ingredient_index.find_dishes(
+                ingredient_ids, limit=PANTRY_DISHES_COUNT,
+            ),
+            'pantry orm': find_dishes_in_db,
+            'view pantry': lambda ingredient_ids=ingredient_ids: client.get(
+                reverse('pantry'), {'ingredients': ingredient_ids},
+            ),
+        }
+        best_dishes = ingredient_index.find_dishes(ingredient_ids, limit=PANTRY_DISHES_COUNT)
+        matching_orm = [
+            (coverage.dish_id, coverage.covered_count, coverage.positions_count) for coverage in best_dishes
+        ] == find_dishes_in_db()
+        log(
+            f'{pantry_size} ingredients: {ingredient_index.count_candidates(ingredient_ids)} '
+            f'candidate dishes, same ranking as ORM: {matching_orm}'
+        )
+        results.extend(
+            measure(f'{name} ({pantry_size})', func, repeat=options['repeat'], query_budget=QUERY_BUDGETS.get(name))
+            for name, func in benchmarks.items()
+        )
+    return results
+
+
+def read_recipe_pages(options, log) -> List[str]:
+    if not options['pages_dir']:
+        randomizer = random.Random(0)
+        log(f'{options["pages"]} synthetic recipe pages')
+        return [build_recipe_page(number, randomizer) for number in range(options['pages'])]
+
+    if os.path.exists(os.path.join(options['pages_dir'], SNAPSHOT_INDEX)):
+        snapshots = SnapshotStore(options['pages_dir'])
+        pages = [read_snapshot(snapshots.directory, digest) for digest in dict.fromkeys(snapshots.digests.values())]
+        log(f'{len(pages)} recipe pages from the snapshots in {options["pages_dir"]}')
+        return pages
+
+    page_paths = sorted(glob.glob(os.path.join(options['pages_dir'], '*.html')))
+    log(f'{len(page_paths)} recipe pages from {options["pages_dir"]}')
+    pages = []
+    for page_path in page_paths:
+        with open(page_path, 'r', encoding='utf-8') as file:
+            pages.append(file.read())
+    return pages
+
+
+def run_parser_suite(options, log) -> List[BenchmarkResult]:
+    pages = read_recipe_pages(options, log)
+    if not pages:
+        return []
+    log(f'{sum(map(len, pages)) / len(pages) / 1024:.0f} KiB per page')
+
+    # every backend has to return the same recipes as the full tree
+    expected_recipes = [parse_recipe_html(page, 'html.parser') for page in pages]
+    results = []
+    for backend in PARSER_BACKENDS:
+        mismatches_count = sum(
+            parse_recipe_html(page, backend) != expected_recipe
+            for page, expected_recipe in zip(pages, expected_recipes)
+        )
+        result = measure(
+            f'parser {backend}',
+            lambda backend=backend: [parse_recipe_html(page, backend) for page in pages],
+            repeat=options['repeat'],
+        )
+        log(f'{backend}: {len(pages) / result.wall_time_ms * 1000:.1f} pages/s, {mismatches_count} mismatches')
+        results.append(result)
+    return results
+
+
+QUANTITIES_CORPUS = os.path.join(os.path.dirname(__file__), 'quantities.tsv')
+QUANTITY_LINES_PER_PAGE = 10
+
+
+def read_quantities_corpus() -> List[List[str]]:
+    # quantity string, portions, expected quantity per portion and units
+    with open(QUANTITIES_CORPUS, 'r', encoding='utf-8') as file:
+        return [line.rstrip('\n').split('\t') for line in file if line.strip() and not line.startswith('#')]
+
+
+def run_quantities_suite(options, log) -> List[BenchmarkResult]:
+    corpus = read_quantities_corpus()
+    mismatches = [
+        (quantity_with_units, parsed, (quantity, units))
+        for quantity_with_units, portions, quantity, units in corpus
+        for parsed in parse_quantities([quantity_with_units], portions)
+        if parsed != (quantity, units)
+    ]
+    log(f'{len(corpus) - len(mismatches)} of {len(corpus)} quantity strings parsed correctly')
+    for quantity_with_units, parsed, expected in mismatches:
+        log(f'{quantity_with_units!r}: {parsed}, expected {expected}')
+
+    # pages of the corpus parsed with the batch API, like parse_recipe does for every page
+    pages = [
+        ([quantity_with_units for quantity_with_units, *_ in corpus[start:start + QUANTITY_LINES_PER_PAGE]], 4)
+        for start in range(0, len(corpus), QUANTITY_LINES_PER_PAGE)
+    ]
+
+    def parse_pages(clear_cache):
+        if clear_cache:
+            parse_quantity.cache_clear()
+            normalize_units.cache_clear()
+        for quantities_with_units, portions in pages:
+            parse_quantities(quantities_with_units, portions)
+
+    results = []
+    for name, clear_cache in (('quantities uncached', True), ('quantities memoized', False)):
+        result = measure(name, lambda clear_cache=clear_cache: parse_pages(clear_cache), repeat=options['repeat'])
+        log(f'{name}: {len(corpus) / result.wall_time_ms * 1000:.0f} lines/s')
+        results.append(result)
+    return results
+
+
+SUITES = {
+    'views': run_views_suite,
+    'indexes': run_indexes_suite,
+    'planner': run_planner_suite,
+    'shopping_list': run_shopping_list_suite,
+    'load': run_load_suite,
+    'contention': run_contention_suite,
+    'search': run_search_suite,
+    'pantry': run_pantry_suite,
+    'parser': run_parser_suite,
+    'quantities': run_quantities_suite,
+}
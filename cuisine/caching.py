@@ -0,0 +1,75 @@
+import datetime
+import threading
+import time
+from typing import Callable, Generic, Optional, Tuple, TypeVar
+
+from django.core.cache import cache
+
+CATALOG_REVISION_KEY = 'catalog_revision'
+CATALOG_CACHE_TIMEOUT = 24 * 60 * 60
+WEEK_MENU_CACHE_TIMEOUT = 2 * 24 * 60 * 60
+
+T = TypeVar('T')
+
+
+def get_catalog_revision() -> int:
+    revision = cache.get(CATALOG_REVISION_KEY)
+    if revision is None:
+        # starting from the current time keeps the revision growing if the key was evicted
+        cache.add(CATALOG_REVISION_KEY, int(time.time()), timeout=None)
+        revision = cache.get(CATALOG_REVISION_KEY, int(time.time()))
+    return revision
+
+
+def bump_catalog_revision() -> None:
+    try:
+        cache.incr(CATALOG_REVISION_KEY)
+    except ValueError:
+        get_catalog_revision()
+
+
+class ProcessCache(Generic[T]):
+    """Собранное из каталога значение в памяти процесса.
+
+    Значение помечается ревизией каталога и загружается заново, когда она меняется, так что правка каталога
+    в любом процессе доходит до всех остальных.
+    """
+
+    def __init__(self, load: Callable[[], T]):
+        self.load = load
+        self._lock = threading.Lock()
+        self._state: Tuple[Optional[int], Optional[T]] = (None, None)
+
+    def get(self) -> T:
+        # the revision is read before loading, so an edit committed during the load triggers one more load
+        revision = get_catalog_revision()
+        loaded_revision, value = self._state
+        if loaded_revision == revision:
+            return value
+
+        with self._lock:
+            loaded_revision, value = self._state
+            if loaded_revision != revision:
+                value = self.load()
+                self._state = (revision, value)
+            return value
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._state = (None, None)
+
+
+def get_catalog_cache_key(*parts) -> str:
+    return ':'.join(str(part) for part in ('catalog', get_catalog_revision(), *parts))
+
+
+def get_week_menu_cache_key(user_id: int, start_date: datetime.date) -> str:
+    return get_catalog_cache_key('week_menu', user_id, start_date.isoformat())
+
+
+def invalidate_week_menu(user_id: int) -> None:
+    today = datetime.date.today()
+    cache.delete_many([
+        get_week_menu_cache_key(user_id, today - datetime.timedelta(days=1)),
+        get_week_menu_cache_key(user_id, today),
+    ])
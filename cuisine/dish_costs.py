@@ -0,0 +1,50 @@
+from collections import defaultdict
+from decimal import Decimal
+from typing import Iterable, Optional, Dict, List
+
+from cuisine.models import Dish, DishCostSummary, IngredientPosition
+from cuisine.transactions import write_transaction
+
+WEIGHT_UNITS = ('г', 'мл')
+
+
+def calculate_ingredient_price(quantity: float, units: Optional[str], price: Optional[Decimal]) -> float:
+    price_per_unit = float(price) if price is not None else 0
+    ingredient_price = quantity * price_per_unit
+    if units in WEIGHT_UNITS:
+        ingredient_price /= 1000
+    return ingredient_price
+
+
+@write_transaction()
+def rebuild_dish_cost_summaries(dish_ids: Optional[Iterable[int]] = None, batch_size: int = 500) -> int:
+    dishes = Dish.objects.all()
+    positions = IngredientPosition.objects.all()
+    if dish_ids is not None:
+        dish_ids = set(dish_ids)
+        dishes = dishes.filter(id__in=dish_ids)
+        positions = positions.filter(dish_id__in=dish_ids)
+
+    dish_ingredients: Dict[int, List[list]] = defaultdict(list)
+    positions = positions.values_list(
+        'dish_id', 'ingredient_id', 'quantity', 'ingredient__units', 'ingredient__price',
+    )
+    for dish_id, ingredient_id, quantity, units, price in positions.iterator():
+        ingredient_price = calculate_ingredient_price(quantity, units, price)
+        dish_ingredients[dish_id].append([ingredient_id, quantity, ingredient_price])
+
+    summaries = [
+        DishCostSummary(
+            dish_id=dish_id,
+            total_price=sum(ingredient_price for _, _, ingredient_price in dish_ingredients[dish_id]),
+            ingredients=dish_ingredients[dish_id],
+        )
+        for dish_id in dishes.values_list('id', flat=True).iterator()
+    ]
+
+    stale_summaries = DishCostSummary.objects.all()
+    if dish_ids is not None:
+        stale_summaries = stale_summaries.filter(dish_id__in=dish_ids)
+    stale_summaries.delete()
+    DishCostSummary.objects.bulk_create(summaries, batch_size=batch_size)
+    return len(summaries)
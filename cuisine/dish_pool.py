@@ -0,0 +1,61 @@
+import math
+import random
+import threading
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+from cuisine.caching import ProcessCache
+from cuisine.models import Dish
+
+# pools of a revision are loaded by tag on first use
+_dish_pools: ProcessCache[Dict[str, array]] = ProcessCache(dict)
+_dish_pools_lock = threading.Lock()
+
+
+def get_dish_pool(tag_name: str) -> array:
+    dish_pools = _dish_pools.get()
+    dish_pool = dish_pools.get(tag_name)
+    if dish_pool is not None:
+        return dish_pool
+
+    with _dish_pools_lock:
+        if tag_name not in dish_pools:
+            dish_ids = Dish.objects.filter(tags__name=tag_name).order_by('id').values_list('id', flat=True)
+            dish_pools[tag_name] = array('q', dish_ids)
+        return dish_pools[tag_name]
+
+
+def invalidate_dish_pools() -> None:
+    _dish_pools.invalidate()
+
+
+def choose_dish_id(tag_name: str) -> int:
+    return random.choice(get_dish_pool(tag_name))
+
+
+def sample_dish_ids(tag_name: str, count: int) -> List[int]:
+    dish_ids = get_dish_pool(tag_name)
+    if len(dish_ids) < count:
+        batches_count = math.ceil(count / len(dish_ids))
+        dish_ids = dish_ids * batches_count
+
+    return random.sample(dish_ids, k=count)
+
+
+def fetch_dishes(dish_ids: List[int]) -> List[Optional[Dish]]:
+    dishes = Dish.objects.in_bulk(dish_ids)
+    # the ids may come from an in-process cache that still lists a dish deleted in another process,
+    # such a dish is None, so the result stays aligned with the ids
+    return [dishes.get(dish_id) for dish_id in dish_ids]
+
+
+def choose_dishes(tag_names: Sequence[str]) -> List[Dish]:
+    dishes = fetch_dishes([choose_dish_id(tag_name) for tag_name in tag_names])
+    while None in dishes:
+        # the pools are reloaded, so a dish is chosen again among the ones that still exist
+        invalidate_dish_pools()
+        dishes = [
+            dish if dish is not None else fetch_dishes([choose_dish_id(tag_name)])[0]
+            for dish, tag_name in zip(dishes, tag_names)
+        ]
+    return dishes
@@ -0,0 +1,107 @@
+import csv
+import datetime
+import json
+from collections import Counter
+from itertools import groupby, islice
+from operator import itemgetter
+from typing import Dict, Iterable, Iterator, Optional, Sequence
+
+from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+
+from cuisine.forms import ShoppingListExportForm
+from cuisine.models import MealPosition
+from cuisine.services import aggregate_dish_counts
+
+EXPORT_FIELDS = ('user_id', 'username', 'ingredient', 'units', 'total_quantity', 'total_price')
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+# Django 3.2 reads streamed content on the event loop under ASGI, where the ORM can't be used,
+# so there the export is built in the view's thread and has to fit in memory
+MAX_BUFFERED_EXPORT_LINES = 100_000
+
+
+def iter_shopping_list_rows(
+        user_ids: Optional[Sequence[int]],
+        start_date: datetime.date,
+        end_date: datetime.date,
+        chunk_size: int = 2000,
+) -> Iterator[Dict[str, object]]:
+    meal_positions = MealPosition.objects.filter(meal__date__range=(start_date, end_date))
+    if user_ids is not None:
+        meal_positions = meal_positions.filter(meal__customer_id__in=user_ids)
+    # positions come ordered by user, so only one user's dishes are held in memory at a time
+    meal_positions = meal_positions.order_by('meal__customer_id').values_list(
+        'meal__customer_id', 'meal__customer__username', 'dish_id', 'quantity',
+    ).iterator(chunk_size=chunk_size)
+
+    for (user_id, username), user_positions in groupby(meal_positions, key=itemgetter(0, 1)):
+        dish_counts = Counter()
+        for _, _, dish_id, quantity in user_positions:
+            dish_counts[dish_id] += quantity
+        for ingredient in aggregate_dish_counts(dish_counts):
+            yield {
+                'user_id': user_id,
+                'username': username,
+                'ingredient': ingredient['name'],
+                'units': ingredient['units_name'],
+                'total_quantity': round(ingredient['total_quantity'], 2),
+                'total_price': round(ingredient['total_price'], 2),
+            }
+
+
+class _LineBuffer:
+    def write(self, line: str) -> str:
+        return line
+
+
+def iter_csv_lines(rows: Iterable[Dict[str, object]]) -> Iterator[str]:
+    writer = csv.DictWriter(_LineBuffer(), fieldnames=EXPORT_FIELDS)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_jsonl_lines(rows: Iterable[Dict[str, object]]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+EXPORT_WRITERS = {
+    'csv': iter_csv_lines,
+    'jsonl': iter_jsonl_lines,
+}
+
+
+@login_required
+def export_shopping_lists(request: HttpRequest) -> HttpResponse:
+    form = ShoppingListExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text(), content_type='text/plain; charset=utf-8')
+
+    start_date, end_date = form.cleaned_data['start'], form.cleaned_data['end']
+    user_ids = form.cleaned_data['users']
+    if not request.user.is_staff:
+        user_ids = [request.user.id]
+    export_format = form.cleaned_data['format']
+
+    lines = EXPORT_WRITERS[export_format](iter_shopping_list_rows(user_ids, start_date, end_date))
+    content_type = EXPORT_CONTENT_TYPES[export_format]
+    if isinstance(request, ASGIRequest):
+        lines = list(islice(lines, MAX_BUFFERED_EXPORT_LINES + 1))
+        if len(lines) > MAX_BUFFERED_EXPORT_LINES:
+            return HttpResponseBadRequest(
+                f'Выгрузка длиннее {MAX_BUFFERED_EXPORT_LINES} строк: сократите период или список пользователей '
+                f'либо воспользуйтесь командой export_shopping_lists',
+                content_type='text/plain; charset=utf-8',
+            )
+        response = HttpResponse(''.join(lines), content_type=content_type)
+    else:
+        response = StreamingHttpResponse(lines, content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_lists_{start_date:%Y%m%d}_{end_date:%Y%m%d}.{export_format}"'
+    )
+    return response
@@ -1,6 +1,8 @@
 from django import forms
 from django.contrib.auth.models import User
 
+from cuisine.models import Ingredient
+
 
 MEAL_TYPE = (
     ('BREAKFAST', 'завтрак'),
@@ -31,4 +33,47 @@ class LoginForm(forms.ModelForm):
 
     class Meta:
         model = User
-        fields = ('username',)
\ No newline at end of file
+        fields = ('username',)
+
+
+EXPORT_FORMATS = (
+    ('csv', 'CSV'),
+    ('jsonl', 'JSON Lines'),
+)
+MAX_EXPORT_DAYS = 366
+
+
+class ShoppingListExportForm(forms.Form):
+    start = forms.DateField(label='с')
+    end = forms.DateField(label='по')
+    users = forms.CharField(label='id пользователей через запятую', required=False)
+    format = forms.ChoiceField(label='формат', choices=EXPORT_FORMATS, required=False)
+
+    def clean_users(self):
+        users = self.cleaned_data['users']
+        if not users:
+            return None
+        try:
+            return sorted({int(user_id) for user_id in users.split(',')})
+        except ValueError:
+            raise forms.ValidationError('Укажите id пользователей числами через запятую')
+
+    def clean_format(self):
+        return self.cleaned_data['format'] or EXPORT_FORMATS[0][0]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start'), cleaned_data.get('end')
+        if start and end:
+            if start > end:
+                raise forms.ValidationError('Начало периода позже его конца')
+            if (end - start).days >= MAX_EXPORT_DAYS:
+                raise forms.ValidationError(f'Период не может быть длиннее {MAX_EXPORT_DAYS} дней')
+        return cleaned_data
+
+
+class PantryForm(forms.Form):
+    ingredients = forms.ModelMultipleChoiceField(
+        label='Что есть в холодильнике',
+        queryset=Ingredient.objects.order_by('name'),
+    )
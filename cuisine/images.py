@@ -0,0 +1,149 @@
+import hashlib
+import json
+import threading
+from io import BytesIO
+from pathlib import PurePosixPath
+from typing import Dict, Optional
+
+from PIL import Image, features
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage, default_storage
+from django.db.models.fields.files import FieldFile
+
+IMAGES_DIRECTORY = 'images'
+DIGEST_INDEX = 'digests.json'
+THUMBNAILS_DIRECTORY = 'thumbnails'
+
+# index cards, week menu grid and recipe page
+THUMBNAIL_SIZES = {
+    'card': (480, 360),
+    'grid': (300, 225),
+    'recipe': (960, 720),
+}
+THUMBNAIL_FORMATS = {
+    'jpeg': 'jpg',
+    'webp': 'webp',
+}
+
+
+class ImageIndex:
+    """Уже сохраненные изображения блюд по имени файла и по sha256 содержимого.
+
+    Хеши хранятся в digests.json каталога изображений и читаются при первом сохранении, так что хешируются только
+    файлы, которых в нем еще нет.
+    """
+
+    def __init__(self, storage: Storage = default_storage, directory: str = IMAGES_DIRECTORY):
+        self.storage = storage
+        self.directory = directory
+        self.index_path = f'{directory}/{DIGEST_INDEX}'
+        self.lock = threading.Lock()
+        self.digests: Optional[Dict[str, str]] = None
+        self.by_hash: Dict[str, str] = {}
+        self.changed = False
+
+        try:
+            _, file_names = storage.listdir(directory)
+        except FileNotFoundError:
+            file_names = []
+        self.by_name: Dict[str, str] = {
+            file_name: f'{directory}/{file_name}'
+            for file_name in file_names
+            if file_name != DIGEST_INDEX
+        }
+
+    def get(self, file_name: str) -> Optional[str]:
+        return self.by_name.get(file_name)
+
+    def _load_digests(self) -> None:
+        saved_digests = {}
+        if self.storage.exists(self.index_path):
+            with self.storage.open(self.index_path, 'rb') as file:
+                try:
+                    saved_digests = json.load(file)
+                except ValueError:
+                    # a cut off index is rebuilt from the files
+                    pass
+
+        self.digests = {}
+        for file_name, path in self.by_name.items():
+            digest = saved_digests.get(file_name)
+            if digest is None:
+                with self.storage.open(path, 'rb') as file:
+                    digest = hashlib.sha256(file.read()).hexdigest()
+            self.digests[file_name] = digest
+            self.by_hash.setdefault(digest, path)
+        self.changed = self.digests != saved_digests
+
+    def store(self, file_name: str, content: bytes) -> str:
+        digest = hashlib.sha256(content).hexdigest()
+        with self.lock:
+            if self.digests is None:
+                self._load_digests()
+            if digest not in self.by_hash:
+                path = self.storage.save(f'{self.directory}/{file_name}', ContentFile(content))
+                self.by_hash[digest] = path
+                self.digests[PurePosixPath(path).name] = digest
+                self.changed = True
+            self.by_name.setdefault(file_name, self.by_hash[digest])
+            return self.by_hash[digest]
+
+    def save(self) -> None:
+        with self.lock:
+            if not self.changed:
+                return
+            if self.storage.exists(self.index_path):
+                self.storage.delete(self.index_path)
+            self.storage.save(self.index_path, ContentFile(json.dumps(self.digests).encode('utf-8')))
+            self.changed = False
+
+
+def get_thumbnail_formats():
+    return [image_format for image_format in THUMBNAIL_FORMATS if image_format == 'jpeg' or features.check(image_format)]
+
+
+def get_thumbnail_name(image_name: str, size: str, image_format: str) -> str:
+    return f'{THUMBNAILS_DIRECTORY}/{size}/{PurePosixPath(image_name).name}.{THUMBNAIL_FORMATS[image_format]}'
+
+
+def generate_thumbnails(image_name: str, storage: Storage = default_storage, overwrite: bool = False) -> int:
+    thumbnail_names = {
+        (size, image_format): get_thumbnail_name(image_name, size, image_format)
+        for size in THUMBNAIL_SIZES
+        for image_format in get_thumbnail_formats()
+    }
+    if not overwrite:
+        thumbnail_names = {
+            key: thumbnail_name
+            for key, thumbnail_name in thumbnail_names.items()
+            if not storage.exists(thumbnail_name)
+        }
+    if not thumbnail_names:
+        return 0
+
+    with storage.open(image_name, 'rb') as file:
+        image = Image.open(file)
+        image.load()
+    image = image.convert('RGB')
+
+    for (size, image_format), thumbnail_name in thumbnail_names.items():
+        thumbnail = image.copy()
+        thumbnail.thumbnail(THUMBNAIL_SIZES[size], Image.LANCZOS)
+        buffer = BytesIO()
+        thumbnail.save(buffer, format=image_format.upper(), quality=80)
+        if storage.exists(thumbnail_name):
+            storage.delete(thumbnail_name)
+        storage.save(thumbnail_name, ContentFile(buffer.getvalue()))
+    return len(thumbnail_names)
+
+
+def get_thumbnail_urls(image: FieldFile, size: str) -> Dict[str, Optional[str]]:
+    if not image:
+        return {'jpeg': None, 'webp': None}
+
+    thumbnail_urls = {'jpeg': image.url, 'webp': None}
+    for image_format in get_thumbnail_formats():
+        thumbnail_name = get_thumbnail_name(image.name, size, image_format)
+        if image.storage.exists(thumbnail_name):
+            thumbnail_urls[image_format] = image.storage.url(thumbnail_name)
+    return thumbnail_urls
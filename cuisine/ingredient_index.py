@@ -0,0 +1,115 @@
+import heapq
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, Iterable, List
+
+from cuisine.caching import ProcessCache
+from cuisine.models import IngredientPosition
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@dataclass
+class DishCoverage:
+    dish_id: int
+    covered_count: int
+    positions_count: int
+
+    @property
+    def coverage(self) -> float:
+        return self.covered_count / self.positions_count
+
+
+@dataclass
+class IngredientIndex:
+    """Инвертированный индекс ингредиент → блюда.
+
+    Блюда пронумерованы строками по возрастанию id: dish_ids[row] и positions_counts[row] — id блюда и число
+    его позиций, а rows_by_ingredient хранит отсортированный array строк блюд на каждую позицию ингредиента,
+    так что блюдо, где ингредиент указан дважды, встречается в нем дважды.
+    """
+
+    dish_ids: array
+    positions_counts: array
+    rows_by_ingredient: Dict[int, array]
+
+    def _get_postings(self, ingredient_ids: Iterable[int]) -> List[array]:
+        return [
+            self.rows_by_ingredient[ingredient_id]
+            for ingredient_id in set(ingredient_ids)
+            if ingredient_id in self.rows_by_ingredient
+        ]
+
+    def count_candidates(self, ingredient_ids: Iterable[int]) -> int:
+        rows = set()
+        for posting in self._get_postings(ingredient_ids):
+            rows.update(posting)
+        return len(rows)
+
+    def find_dishes(self, ingredient_ids: Iterable[int], limit: int) -> List[DishCoverage]:
+        # dishes without any of the ingredients are never ranked
+        postings = self._get_postings(ingredient_ids)
+        if not postings:
+            return []
+        if numpy is None:
+            best_rows = self._rank_rows(postings, limit)
+        else:
+            best_rows = self._rank_rows_with_numpy(postings, limit)
+        return [
+            DishCoverage(self.dish_ids[row], covered_count, self.positions_counts[row])
+            for row, covered_count in best_rows
+        ]
+
+    def _rank_rows(self, postings: List[array], limit: int) -> List[tuple]:
+        covered_counts = Counter()
+        for posting in postings:
+            covered_counts.update(posting)
+        positions_counts = self.positions_counts
+        return heapq.nlargest(
+            limit,
+            covered_counts.items(),
+            key=lambda item: (item[1] / positions_counts[item[0]], item[1], -item[0]),
+        )
+
+    def _rank_rows_with_numpy(self, postings: List[array], limit: int) -> List[tuple]:
+        rows = numpy.concatenate([numpy.frombuffer(posting, dtype=numpy.int64) for posting in postings])
+        covered_counts = numpy.bincount(rows, minlength=len(self.dish_ids))
+        candidate_rows = numpy.flatnonzero(covered_counts)
+        candidate_counts = covered_counts[candidate_rows]
+        coverages = candidate_counts / numpy.frombuffer(self.positions_counts, dtype=numpy.int64)[candidate_rows]
+        # rows follow dish ids, so ties go to the lower dish id like in the pure Python ranking
+        order = numpy.lexsort((candidate_rows, -candidate_counts, -coverages))[:limit]
+        return list(zip(candidate_rows[order].tolist(), candidate_counts[order].tolist()))
+
+
+def load_ingredient_index() -> IngredientIndex:
+    dish_ids = array('q')
+    positions_counts = array('q')
+    rows_by_ingredient = {}
+    # positions come ordered by dish, so every ingredient's rows are appended already sorted
+    positions = IngredientPosition.objects.order_by('dish_id').values_list('dish_id', 'ingredient_id')
+    for row, (dish_id, dish_positions) in enumerate(groupby(positions.iterator(), key=itemgetter(0))):
+        positions_count = 0
+        for _, ingredient_id in dish_positions:
+            rows_by_ingredient.setdefault(ingredient_id, array('q')).append(row)
+            positions_count += 1
+        dish_ids.append(dish_id)
+        positions_counts.append(positions_count)
+    return IngredientIndex(dish_ids=dish_ids, positions_counts=positions_counts, rows_by_ingredient=rows_by_ingredient)
+
+
+_ingredient_index: ProcessCache[IngredientIndex] = ProcessCache(load_ingredient_index)
+
+
+def get_ingredient_index() -> IngredientIndex:
+    return _ingredient_index.get()
+
+
+def invalidate_ingredient_index() -> None:
+    _ingredient_index.invalidate()
@@ -0,0 +1,113 @@
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional
+
+from django.db import transaction
+
+from cuisine.caching import ProcessCache
+from cuisine.dish_costs import calculate_ingredient_price
+from cuisine.models import Ingredient, IngredientPosition
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@dataclass
+class IngredientMatrix:
+    """Разреженная матрица блюдо × ингредиент в формате CSR.
+
+    Строка блюда лежит в columns[indptr[row]:indptr[row + 1]] и quantities с тем же срезом,
+    а unit_prices хранит цену единицы ингредиента с уже учтенным пересчетом г/мл.
+    """
+
+    dish_rows: Dict[int, int]
+    indptr: 'numpy.ndarray'
+    columns: 'numpy.ndarray'
+    quantities: 'numpy.ndarray'
+    ingredient_ids: 'numpy.ndarray'
+    ingredient_names: List[str]
+    ingredient_units: List[Optional[str]]
+    unit_prices: 'numpy.ndarray'
+
+    def aggregate(self, dish_counts: Mapping[int, float]) -> List[Dict[str, str]]:
+        known_dish_ids = [dish_id for dish_id in dish_counts if dish_id in self.dish_rows]
+        rows = numpy.array([self.dish_rows[dish_id] for dish_id in known_dish_ids], dtype=numpy.int64)
+        counts = numpy.array([dish_counts[dish_id] for dish_id in known_dish_ids], dtype=numpy.float64)
+
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        # positions of the selected rows' nonzeros, so the product touches only the user's dishes
+        offsets = numpy.repeat(starts - numpy.cumsum(lengths) + lengths, lengths)
+        positions = offsets + numpy.arange(lengths.sum())
+
+        columns, inverse = numpy.unique(self.columns[positions], return_inverse=True)
+        total_quantities = numpy.bincount(
+            inverse, weights=self.quantities[positions] * numpy.repeat(counts, lengths), minlength=len(columns),
+        )
+        total_prices = total_quantities * self.unit_prices[columns]
+        return [
+            {
+                'name': self.ingredient_names[column],
+                'total_quantity': total_quantity,
+                'units_name': self.ingredient_units[column],
+                'total_price': total_price,
+            }
+            for column, total_quantity, total_price in zip(
+                columns.tolist(), total_quantities.tolist(), total_prices.tolist(),
+            )
+        ]
+
+
+def is_ingredient_matrix_available() -> bool:
+    return numpy is not None
+
+
+@transaction.atomic
+def load_ingredient_matrix() -> IngredientMatrix:
+    ingredient_ids = []
+    ingredient_names = []
+    ingredient_units = []
+    unit_prices = []
+    for ingredient_id, name, units, price in Ingredient.objects.order_by('id').values_list(
+            'id', 'name', 'units', 'price',
+    ).iterator():
+        ingredient_ids.append(ingredient_id)
+        ingredient_names.append(name)
+        ingredient_units.append(units)
+        unit_prices.append(calculate_ingredient_price(1, units, price))
+    ingredient_ids = numpy.array(ingredient_ids, dtype=numpy.int64)
+
+    dish_ids = []
+    position_ingredient_ids = []
+    quantities = []
+    positions = IngredientPosition.objects.order_by('dish_id').values_list('dish_id', 'ingredient_id', 'quantity')
+    for dish_id, ingredient_id, quantity in positions.iterator():
+        dish_ids.append(dish_id)
+        position_ingredient_ids.append(ingredient_id)
+        quantities.append(quantity)
+
+    row_dish_ids, row_lengths = numpy.unique(numpy.array(dish_ids, dtype=numpy.int64), return_counts=True)
+    indptr = numpy.zeros(len(row_dish_ids) + 1, dtype=numpy.int64)
+    numpy.cumsum(row_lengths, out=indptr[1:])
+    return IngredientMatrix(
+        dish_rows={dish_id: row for row, dish_id in enumerate(row_dish_ids.tolist())},
+        indptr=indptr,
+        columns=numpy.searchsorted(ingredient_ids, numpy.array(position_ingredient_ids, dtype=numpy.int64)),
+        quantities=numpy.array(quantities, dtype=numpy.float64),
+        ingredient_ids=ingredient_ids,
+        ingredient_names=ingredient_names,
+        ingredient_units=ingredient_units,
+        unit_prices=numpy.array(unit_prices, dtype=numpy.float64),
+    )
+
+
+_ingredient_matrix: ProcessCache[IngredientMatrix] = ProcessCache(load_ingredient_matrix)
+
+
+def get_ingredient_matrix() -> IngredientMatrix:
+    return _ingredient_matrix.get()
+
+
+def invalidate_ingredient_matrix() -> None:
+    _ingredient_matrix.invalidate()
@@ -0,0 +1,208 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpRequest, HttpResponse, Http404
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+QUERIES_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started_at
+            self.queries_count += 1
+
+
+_current_metrics: ContextVar[Optional[RequestMetrics]] = ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.observations = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.observations += 1
+
+    def export(self, metric_name: str, view_name: str) -> str:
+        lines = []
+        cumulative_count = 0
+        for upper_bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            cumulative_count += count
+            lines.append(f'{metric_name}_bucket{{view="{view_name}",le="{upper_bound}"}} {cumulative_count}')
+        lines.append(f'{metric_name}_sum{{view="{view_name}"}} {self.total}')
+        lines.append(f'{metric_name}_count{{view="{view_name}"}} {self.observations}')
+        return '\n'.join(lines)
+
+
+class MetricsRegistry:
+    """Гистограммы метрик запросов по view, отдельные для каждого процесса."""
+
+    METRICS = {
+        'foodplan_request_queries': QUERIES_BUCKETS,
+        'foodplan_request_sql_seconds': SECONDS_BUCKETS,
+        'foodplan_request_template_seconds': SECONDS_BUCKETS,
+        'foodplan_request_seconds': SECONDS_BUCKETS,
+        'foodplan_response_bytes': BYTES_BUCKETS,
+    }
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, view_name: str, values: Dict[str, float]) -> None:
+        with self._lock:
+            for metric_name, value in values.items():
+                key = (metric_name, view_name)
+                if key not in self._histograms:
+                    self._histograms[key] = Histogram(self.METRICS[metric_name])
+                self._histograms[key].observe(value)
+
+    def export(self) -> str:
+        with self._lock:
+            lines = []
+            for metric_name in self.METRICS:
+                histograms = [
+                    histogram.export(metric_name, view_name)
+                    for (histogram_metric_name, view_name), histogram in sorted(self._histograms.items())
+                    if histogram_metric_name == metric_name
+                ]
+                if histograms:
+                    lines.append(f'# TYPE {metric_name} histogram')
+                    lines.extend(histograms)
+            return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        started_at = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics = _current_metrics.get()
+            if metrics is not None:
+                metrics.template_time += time.perf_counter() - started_at
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name).template, self)
+
+
+@contextmanager
+def instrument_connections(metrics: Optional[RequestMetrics] = None):
+    metrics = metrics or _current_metrics.get()
+    with ExitStack() as stack:
+        if metrics is not None:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+        yield
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            # lets Django's handler see the instance as a coroutine function
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if self.is_async:
+            return self.__acall__(request)
+
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        started_at = time.perf_counter()
+        try:
+            with instrument_connections(metrics):
+                response = self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self.record_metrics(request, response, metrics, time.perf_counter() - started_at)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        # async views count their queries in the worker threads, see cuisine.asynchronous
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        started_at = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self.record_metrics(request, response, metrics, time.perf_counter() - started_at)
+
+    def record_metrics(
+            self,
+            request: HttpRequest,
+            response: HttpResponse,
+            metrics: RequestMetrics,
+            request_time: float,
+    ) -> HttpResponse:
+        view_name = request.resolver_match.url_name if request.resolver_match else None
+        if not view_name or view_name == 'metrics':
+            return response
+
+        values = {
+            'foodplan_request_queries': metrics.queries_count,
+            'foodplan_request_sql_seconds': metrics.sql_time,
+            'foodplan_request_template_seconds': metrics.template_time,
+            'foodplan_request_seconds': request_time,
+        }
+        if not response.streaming:
+            values['foodplan_response_bytes'] = len(response.content)
+        registry.observe(view_name, values)
+
+        logger.info(json.dumps({
+            'event': 'request_metrics',
+            'view': view_name,
+            'method': request.method,
+            'status': response.status_code,
+            'queries': metrics.queries_count,
+            'sql_ms': round(metrics.sql_time * 1000, 2),
+            'template_ms': round(metrics.template_time * 1000, 2),
+            'total_ms': round(request_time * 1000, 2),
+            'response_bytes': values.get('foodplan_response_bytes'),
+        }))
+        return response
+
+
+def show_metrics(request: HttpRequest) -> HttpResponse:
+    if request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS:
+        raise Http404
+    return HttpResponse(registry.export(), content_type='text/plain; version=0.0.4')
@@ -0,0 +1,64 @@
+import logging
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from cuisine.benchmarks.suites import SUITES
+
+
+class Command(BaseCommand):
+    help = 'Run benchmarks against a synthetic catalog in a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suites', nargs='*', help=f'Наборы бенчмарков: {", ".join(SUITES)}')
+        parser.add_argument('--dishes', default=1000, type=int, help='Число блюд в каталоге')
+        parser.add_argument('--ingredients', default=300, type=int, help='Число ингредиентов')
+        parser.add_argument('--tags', default=10, type=int, help='Число тэгов помимо типов приема пищи')
+        parser.add_argument('--ingredients-per-dish', default=8, type=int, help='Ингредиентов в блюде')
+        parser.add_argument('--users', default=20, type=int, help='Число пользователей')
+        parser.add_argument('--weeks', default=4, type=int, help='Недель истории приемов пищи у пользователя')
+        parser.add_argument('--repeat', default=5, type=int, help='Число замеров на бенчмарк')
+        parser.add_argument('--requests', default=50, type=int, help='Запросов на клиента в нагрузочном наборе')
+        parser.add_argument('--pages', default=50, type=int, help='Число синтетических страниц рецептов')
+        parser.add_argument('--pages-dir', help='Каталог со страницами рецептов *.html или снимками recipes --parse вместо синтетических')
+
+    def handle(self, *args, **options):
+        suites = options['suites'] or list(SUITES)
+        unknown_suites = set(suites) - set(SUITES)
+        if unknown_suites:
+            raise CommandError(f'Unknown suites: {", ".join(sorted(unknown_suites))}')
+
+        logging.getLogger('cuisine.instrumentation').setLevel(logging.WARNING)
+        setup_test_environment()
+        temporary_directory = tempfile.TemporaryDirectory()
+        # pages and menus cached by earlier runs belong to other databases
+        cache_settings = override_settings(CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': os.path.join(temporary_directory.name, 'cache'),
+            },
+        })
+        cache_settings.enable()
+        if connection.vendor == 'sqlite':
+            # an in-memory database would ignore the journal and locking settings under test
+            connection.settings_dict['TEST']['NAME'] = os.path.join(temporary_directory.name, 'benchmark.sqlite3')
+        old_database_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = []
+            for suite in suites:
+                self.stdout.write(f'Suite {suite}')
+                for result in SUITES[suite](options, self.stdout.write):
+                    self.stdout.write(str(result))
+                    results.append(result)
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+            cache_settings.disable()
+            temporary_directory.cleanup()
+            teardown_test_environment()
+
+        over_budget = [result.name for result in results if result.over_budget]
+        if over_budget:
+            raise CommandError(f'Budget exceeded: {", ".join(over_budget)}')
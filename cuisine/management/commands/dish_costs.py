@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from cuisine.dish_costs import rebuild_dish_cost_summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuild precomputed dish cost summaries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dish',
+            nargs='*',
+            type=int,
+            help='Пересчитывает только указанные блюда',
+        )
+        parser.add_argument(
+            '--batch-size',
+            default=500,
+            type=int,
+            help='Размер пачки при записи сводок',
+        )
+
+    def handle(self, *args, **options):
+        summaries_count = rebuild_dish_cost_summaries(options['dish'], batch_size=options['batch_size'])
+        self.stdout.write(f'Rebuilt {summaries_count} dish cost summaries')
@@ -0,0 +1,62 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cuisine.exports import EXPORT_WRITERS, iter_shopping_list_rows
+
+
+class Command(BaseCommand):
+    help = 'Export shopping lists of users for a date range as CSV or JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            type=datetime.date.fromisoformat,
+            default=datetime.date.today(),
+            help='Первый день периода, YYYY-MM-DD',
+        )
+        parser.add_argument(
+            '--end',
+            type=datetime.date.fromisoformat,
+            help='Последний день периода, YYYY-MM-DD, по умолчанию неделя от начала',
+        )
+        parser.add_argument(
+            '--users',
+            nargs='*',
+            type=int,
+            help='Выгружает только указанных пользователей',
+        )
+        parser.add_argument(
+            '--format',
+            default='csv',
+            choices=EXPORT_WRITERS,
+            help='Формат выгрузки',
+        )
+        parser.add_argument(
+            '--output',
+            default='-',
+            help='Файл выгрузки, по умолчанию stdout',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            default=2000,
+            type=int,
+            help='Число строк, читаемых из базы за раз',
+        )
+
+    def handle(self, *args, **options):
+        start_date = options['start']
+        end_date = options['end'] or start_date + datetime.timedelta(days=6)
+        if start_date > end_date:
+            raise CommandError('The start date is after the end date')
+
+        rows = iter_shopping_list_rows(options['users'], start_date, end_date, chunk_size=options['chunk_size'])
+        lines = EXPORT_WRITERS[options['format']](rows)
+        if options['output'] == '-':
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            output.writelines(lines)
+        self.stdout.write(f'Shopping lists of {start_date} - {end_date} exported to {options["output"]}')
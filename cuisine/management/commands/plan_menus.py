@@ -0,0 +1,82 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from cuisine.planner import MenuPlanner, get_dish_catalog
+from cuisine.services import fill_missing_meals, generate_dates_from_today
+
+
+def plan_users_menus(user_ids, dates, chunk_size, planner):
+    meals_count = 0
+    try:
+        for start in range(0, len(user_ids), chunk_size):
+            meals_count += fill_missing_meals(user_ids[start:start + chunk_size], dates, planner=planner)
+    finally:
+        connection.close()
+    return meals_count
+
+
+class Command(BaseCommand):
+    help = 'Generate menus of the next days for all active users'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            default=7,
+            type=int,
+            help='На сколько дней вперед заполнять меню',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            default=500,
+            type=int,
+            help='Число пользователей в одной транзакции',
+        )
+        parser.add_argument(
+            '--max-cost',
+            type=float,
+            help='Максимальная стоимость меню на неделю',
+        )
+        parser.add_argument(
+            '--no-repeat-days',
+            type=int,
+            help='Блюдо не повторяется чаще, чем раз в указанное число дней',
+        )
+        parser.add_argument(
+            '--workers',
+            default=1,
+            type=int,
+            help='Число потоков, каждый обрабатывает свой диапазон id пользователей',
+        )
+
+    def handle(self, *args, **options):
+        dates = generate_dates_from_today(days_count=options['days'])
+        user_ids = list(User.objects.filter(is_active=True).order_by('id').values_list('id', flat=True))
+        workers = max(1, min(options['workers'], len(user_ids)))
+        range_size = -(-len(user_ids) // workers) if user_ids else 1
+        user_id_ranges = [user_ids[start:start + range_size] for start in range(0, len(user_ids), range_size)]
+
+        planner = None
+        if options['max_cost'] is not None or options['no_repeat_days'] is not None:
+            planner = MenuPlanner(
+                get_dish_catalog(),
+                max_weekly_cost=options['max_cost'],
+                no_repeat_days=options['no_repeat_days'] or 7,
+            )
+
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            meals_count = sum(executor.map(
+                lambda user_id_range: plan_users_menus(user_id_range, dates, options['chunk_size'], planner),
+                user_id_ranges,
+            ))
+        elapsed = time.perf_counter() - started_at
+
+        rows_count = meals_count * 2
+        self.stdout.write(
+            f'{len(user_ids)} users, {meals_count} meals filled in {elapsed:.2f} s: '
+            f'{len(user_ids) / elapsed:.1f} users/s, {rows_count / elapsed:.1f} rows/s'
+        )
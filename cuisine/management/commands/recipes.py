@@ -1,144 +1,61 @@
 import json
 import os
+import threading
+import time
 import requests
 
-from bs4 import BeautifulSoup
-
-from requests.exceptions import HTTPError
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
+from requests.adapters import HTTPAdapter
+from requests.exceptions import HTTPError, RequestException
 from urllib.parse import urlsplit
+from urllib3.util.retry import Retry
 from django.db import transaction
-from django.core.files.base import ContentFile
-from django.conf import settings
-from django.core.management.base import BaseCommand, CommandError
-from pathlib import Path
+from django.core.management.base import BaseCommand
+from cuisine.dish_costs import rebuild_dish_cost_summaries
+from cuisine.recipe_parsing import DEFAULT_PARSER_BACKEND, PARSER_BACKENDS, parse_recipe_html
+from cuisine.search import index_dishes
+from cuisine.signals import reset_catalog_caches
+from cuisine.snapshots import SNAPSHOTS_DIRECTORY, SnapshotStore, parse_snapshots
+from cuisine.transactions import write_transaction
+from cuisine.images import ImageIndex, generate_thumbnails
 from cuisine.models import Dish, Tag, IngredientPosition, Ingredient
 
+RECIPE_URL_TEMPLATE = 'https://eda.ru/recepty/supy/sirnij-sup-po-francuzski-s-kuricej-{number}'
+FIRST_RECIPE_NUMBER = 14444
+LAST_RECIPE_NUMBER = 16945
+RECIPES_FILE = 'recipes.jsonl'
+CHECKPOINT_FILE = 'recipes.checkpoint'
 
-def get_soup(url):
-    response = requests.get(url)
-    response.raise_for_status()
-
-    html_doc = response.text
-    return BeautifulSoup(html_doc, 'html.parser')
-
-
-def parse_recipe(url):
-    soup = get_soup(url)
-
-    try:
-        image_url = soup.select_one('.css-17zastc .css-3uhzwz-ImageBase img').get('src')
-    except AttributeError:
-        return None
-
-    name = soup.h1.text.replace('\xa0', ' ')
-    tags = list(soup.find(class_='css-a90bfp').stripped_strings)
 
-    ingredients = [ingredient.text for ingredient in soup.find_all(class_='css-12s4kyf-Info')]
-
-    portion_and_time = list(soup.find(class_='css-1k7lmq6').stripped_strings)
-    portions = portion_and_time[1]
-    cooking_time = portion_and_time[-1]
-
-    quantity_soup = soup.find_all(class_='css-1t5teuh-Info')
-    quantities = parse_quantity_and_units(quantity_soup, portions)
+def get_html(url, session=requests):
+    response = session.get(url, timeout=30)
+    response.raise_for_status()
+    # without a charset in Content-Type requests falls back to ISO-8859-1, while the pages are in UTF-8
+    if 'charset' not in response.headers.get('Content-Type', ''):
+        response.encoding = 'utf-8'
+    return response.text
 
-    if not quantities:
-        return None
 
-    ingredients_and_quantity = dict(zip(ingredients, quantities))
+def parse_recipe(url, session=requests, parser=None, snapshots=None):
+    html = get_html(url, session=session)
+    if snapshots is not None:
+        snapshots.store(url, html)
+    return parse_recipe_html(html, parser=parser)
 
-    recipe_steps = [step.text for step in soup.find_all(class_='css-8repvw-Info')]
-    recipe = '\n'.join(recipe_steps).replace('\xa0', ' ')
 
-    dish_recipe = {
-        'name': name,
-        'tags': tags,
-        'ingredients_and_quantity': ingredients_and_quantity,
-        'cooking_time': cooking_time,
-        'recipe': recipe,
-        'image': image_url,
-    }
-    return dish_recipe
-
-
-def parse_quantity_and_units(soup, portions):
-    quantities = []
-    for layout in soup:
-        quantity = 0
-        quantity_with_units = layout.text
-        units = ''.join(char for char in quantity_with_units if not char.isdigit()).strip()
-
-        if '/' in quantity_with_units:
-            fractions = {'1/2': 0.5, '1/4': 0.25}
-            units = units.replace('/', '')
-            quantity_string = quantity_with_units.replace(units, '').strip()
-            digits = quantity_string.split(' ')[0]
-
-            for fraction in fractions:
-                if fraction == digits:
-                    quantity = fractions[digits]
-                elif fraction in digits:
-                    integer = digits.replace(fraction, '')
-                    integer = int(integer)
-                    quantity = integer + fractions[fraction]
-                    break
-
-        elif ',' in quantity_with_units:
-            units = units.strip(',')
-            quantity = float(quantity_with_units.replace(units, '').replace(',', '.'))
-        elif '.' in quantity_with_units:
-            units = units.strip('.')
-            quantity = float(quantity_with_units.replace(units, ''))
-        elif units == quantity_with_units:
-            quantity = 0
-        else:
-            quantity = float(quantity_with_units.replace(units, '').strip())
-
-        quantity /= int(portions)
-        units, quantity = normalize_units(units, quantity)
-
-        quantities.append((f'{quantity:.3f}', units))
-    return quantities
-
-
-def normalize_units(units, quantity):
-    if 'штук' in units:
-        units = 'штука'
-    elif 'стол' in units:
-        units = 'ст л'
-    elif 'чай' in units:
-        units = 'ч л'
-    elif 'голов' in units:
-        units = 'головка'
-    elif 'пуч' in units:
-        units = 'пучок'
-    elif 'стакан' in units:
-        units = 'стакан'
-    elif 'зубч' in units:
-        units = 'зубчик'
-    elif 'стеб' in units:
-        units = 'стебель'
-    elif 'кус' in units:
-        units = 'кусок'
-    elif 'бан' in units:
-        units = 'банка'
-    elif units == 'кг' or 'кило' in units:
-        units = 'г'
-        quantity *= 1000
-    elif units == 'л' or 'литр' in units:
-        units = 'мл'
-        quantity *= 1000
-    return units, quantity
-
-
-@transaction.atomic
+@write_transaction()
 def record_recipe(recipe):
-    dish, created = Dish.objects.get_or_create(name=recipe['name'])
+    dish, created = Dish.objects.get_or_create(
+        name=recipe['name'],
+        defaults={'cooking_time': recipe['cooking_time'], 'recipe': recipe['recipe']},
+    )
     if not created:
+        # dishes recorded without their text by an earlier import get it now, their ingredients stay as they are
+        dish.cooking_time = recipe['cooking_time']
+        dish.recipe = recipe['recipe']
+        dish.save(update_fields=['cooking_time', 'recipe'])
         return None
-    dish.name = recipe['name']
-    dish.cooking_time = recipe['cooking_time']
-    dish.recipe = recipe['recipe']
 
     tags = [Tag.objects.get_or_create(name=tag)[0] for tag in recipe['tags']]
     dish.tags.add(*tags)
@@ -166,11 +83,88 @@ def record_recipe(recipe):
         positions.append(position)
 
     IngredientPosition.objects.bulk_create(positions)
-    try:
-        download_image(recipe['image'], dish)
-    except CommandError:
-        transaction.set_rollback(True)
-        return None
+    rebuild_dish_cost_summaries([dish.id])
+    return dish
+
+
+def chunked(items, size):
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def validate_recipe(recipe, ingredients, dish_names):
+    if recipe['name'] in dish_names:
+        return 'dish already exists'
+    for ingredient, (_, units) in recipe['ingredients_and_quantity'].items():
+        if ingredient not in ingredients:
+            return f'unknown ingredient {ingredient}'
+        if units != 'по вкусу' and units != ingredients[ingredient].units:
+            return f'units of {ingredient} are {units}, expected {ingredients[ingredient].units}'
+    return None
+
+
+@write_transaction()
+def record_recipes_chunk(recipes, ingredients, tags):
+    new_tag_names = {tag for recipe in recipes for tag in recipe['tags']} - tags.keys()
+    Tag.objects.bulk_create([Tag(name=tag) for tag in new_tag_names])
+    tags.update({tag.name: tag for tag in Tag.objects.filter(name__in=new_tag_names)})
+
+    Dish.objects.bulk_create([
+        Dish(name=recipe['name'], cooking_time=recipe['cooking_time'], recipe=recipe['recipe'])
+        for recipe in recipes
+    ])
+    dish_ids = dict(
+        Dish.objects.filter(name__in=[recipe['name'] for recipe in recipes]).values_list('name', 'id')
+    )
+
+    dish_tags = []
+    positions = []
+    for recipe in recipes:
+        dish_id = dish_ids[recipe['name']]
+        dish_tags.extend(
+            Tag.dishes.through(tag_id=tags[tag].id, dish_id=dish_id)
+            for tag in set(recipe['tags'])
+        )
+        for ingredient, (quantity, units) in recipe['ingredients_and_quantity'].items():
+            positions.append(IngredientPosition(
+                ingredient=ingredients[ingredient],
+                quantity=0 if units == 'по вкусу' else float(quantity),
+                dish_id=dish_id,
+            ))
+    Tag.dishes.through.objects.bulk_create(dish_tags)
+    IngredientPosition.objects.bulk_create(positions)
+    rebuild_dish_cost_summaries(dish_ids.values())
+    # bulk inserts don't send the signals that keep the search index and the catalog caches in sync
+    index_dishes(dish_ids.values())
+    transaction.on_commit(reset_catalog_caches)
+    return dish_ids
+
+
+def record_recipes_batch(recipes, batch_size=500, log=print):
+    ingredients = {ingredient.name: ingredient for ingredient in Ingredient.objects.all()}
+    tags = {tag.name: tag for tag in Tag.objects.all()}
+    dish_names = set(Dish.objects.values_list('name', flat=True))
+
+    dish_images = []
+    rejected = []
+    for chunk in chunked(recipes, batch_size):
+        accepted = []
+        for recipe in chunk:
+            reason = validate_recipe(recipe, ingredients, dish_names)
+            if reason:
+                rejected.append((recipe['name'], reason))
+                continue
+            dish_names.add(recipe['name'])
+            accepted.append(recipe)
+        if not accepted:
+            continue
+
+        dish_ids = record_recipes_chunk(accepted, ingredients, tags)
+        dish_images.extend((dish_ids[recipe['name']], recipe['image']) for recipe in accepted)
+        log(f'{len(dish_images)} recipes recorded, {len(rejected)} rejected')
+
+    return dish_images, rejected
 
 
 def get_common_units(ingredients_and_quantity):
@@ -200,42 +194,219 @@ def record_ingredients(ingredients_and_quantity):
     Ingredient.objects.bulk_create(ingredients)
 
 
-def download_image(url, dish):
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        image_content = ContentFile(response.content)
-    except ConnectionError:
-        raise CommandError('ConnectionError. Try again later')
-    except HTTPError:
-        raise CommandError(f'Photo from {url} is not found')
-    image_name = os.path.split(urlsplit(url).path)[-1]
-    Path(os.path.join(settings.BASE_DIR, 'media')).mkdir(exist_ok=True)
-    if image_name not in os.listdir(settings.MEDIA_ROOT):
+def fetch_image(url, session):
+    response = session.get(url, timeout=30)
+    response.raise_for_status()
+    return response.content
 
-        dish.image.save(image_name, image_content, save=True)
 
+def store_image(url, session, image_index):
+    image_name = os.path.split(urlsplit(url).path)[-1]
+    if image_path := image_index.get(image_name):
+        return image_path
+    return image_index.store(image_name, fetch_image(url, session))
+
+
+def download_images(dish_images, workers=8, retries=3, batch_size=500, log=print):
+    image_index = ImageIndex()
+    session = make_session(workers, retries)
+
+    image_paths = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(store_image, url, session, image_index): dish_id
+            for dish_id, url in dish_images
+        }
+        for future in as_completed(futures):
+            try:
+                image_paths[futures[future]] = future.result()
+            except (RequestException, OSError) as error:
+                # a full or read-only storage fails the image, but the ones already saved are still attached
+                log(f'Image of dish {futures[future]} is not downloaded: {error}')
+
+        thumbnail_futures = {
+            executor.submit(generate_thumbnails, image_path): image_path
+            for image_path in set(image_paths.values())
+        }
+        for future in as_completed(thumbnail_futures):
+            try:
+                future.result()
+            except OSError as error:
+                log(f'Thumbnails of {thumbnail_futures[future]} are not generated: {error}')
 
-def fill_recipes_json():
-    recipes = []
-    for number in range(14444, 16945):
-        try:
-            url = f'https://eda.ru/recepty/supy/sirnij-sup-po-francuzski-s-kuricej-{number}'
-            if recipe := parse_recipe(url):
-                recipes.append(recipe)
-        except HTTPError:
-            continue
-    return recipes
+    try:
+        image_index.save()
+    except OSError as error:
+        log(f'Image digests are not saved, the new images will be hashed again on the next run: {error}')
+
+    dishes = Dish.objects.in_bulk(image_paths)
+    for dish_id, dish in dishes.items():
+        dish.image.name = image_paths[dish_id]
+    Dish.objects.bulk_update(dishes.values(), ['image'], batch_size=batch_size)
+    return len(dishes)
+
+
+def get_missing_dish_images(recipes):
+    dish_ids = dict(Dish.objects.filter(image='').values_list('name', 'id'))
+    return [
+        (dish_ids[recipe['name']], recipe['image'])
+        for recipe in recipes
+        if recipe['name'] in dish_ids
+    ]
 
 
-def get_recipes_json_file(recipes):
-    with open('recipes.json', 'w', encoding='utf-8') as file:
-        json.dump(recipes, file, ensure_ascii=False, indent=4)
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_request_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_request_at - now
+            self.next_request_at = max(now, self.next_request_at) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def make_session(workers, retries):
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=('GET',),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def read_checkpoint(checkpoint_path):
+    if not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path, 'r', encoding='utf-8') as file:
+        return {int(line) for line in file if line.strip().isdigit()}
+
+
+def fetch_recipe(number, url_template, session, rate_limiter, parser=DEFAULT_PARSER_BACKEND, snapshots=None):
+    rate_limiter.wait()
+    try:
+        return parse_recipe(url_template.format(number=number), session=session, parser=parser, snapshots=snapshots)
+    except HTTPError as error:
+        if error.response is not None and error.response.status_code in (404, 410):
+            return None
+        raise
+    except (AttributeError, IndexError, ValueError):
+        return None
 
 
-def read_json():
-    with open('recipes.json', 'r', encoding='utf-8') as file:
-        return json.load(file)
+def fill_recipes_file(
+        recipes_path=RECIPES_FILE,
+        url_template=RECIPE_URL_TEMPLATE,
+        numbers=range(FIRST_RECIPE_NUMBER, LAST_RECIPE_NUMBER),
+        workers=8,
+        rate=5,
+        retries=3,
+        checkpoint_path=CHECKPOINT_FILE,
+        parser=DEFAULT_PARSER_BACKEND,
+        snapshots_directory=SNAPSHOTS_DIRECTORY,
+        log=print,
+):
+    checkpoint = read_checkpoint(checkpoint_path)
+    pending_numbers = [number for number in numbers if number not in checkpoint]
+    log(f'{len(checkpoint)} pages in checkpoint, {len(pending_numbers)} to fetch')
+
+    terminate_last_line(recipes_path)
+    recipes_count = 0
+    session = make_session(workers, retries)
+    rate_limiter = RateLimiter(rate)
+    snapshots = SnapshotStore(snapshots_directory)
+    with open(recipes_path, 'a', encoding='utf-8') as recipes_file, \
+            open(checkpoint_path, 'a', encoding='utf-8') as checkpoint_file, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(fetch_recipe, number, url_template, session, rate_limiter, parser, snapshots): number
+            for number in pending_numbers
+        }
+        for done_count, future in enumerate(as_completed(futures), start=1):
+            number = futures[future]
+            try:
+                recipe = future.result()
+            except RequestException as error:
+                log(f'Page {number} failed, it will be retried on the next run: {error}')
+                continue
+            if recipe:
+                append_recipe(recipes_file, recipe)
+                recipes_count += 1
+            checkpoint_file.write(f'{number}\n')
+            checkpoint_file.flush()
+            if done_count % 100 == 0:
+                log(f'{done_count}/{len(pending_numbers)} pages fetched')
+
+    return recipes_count
+
+
+def reparse_recipes_file(
+        recipes_path=RECIPES_FILE,
+        snapshots_directory=SNAPSHOTS_DIRECTORY,
+        parser=DEFAULT_PARSER_BACKEND,
+        processes=None,
+        log=print,
+):
+    snapshots = SnapshotStore(snapshots_directory)
+    log(f'{len(snapshots)} pages in {snapshots_directory}')
+
+    # the old file stays in place until every page is parsed
+    temporary_path = f'{recipes_path}.tmp'
+    recipes_count = 0
+    try:
+        with open(temporary_path, 'w', encoding='utf-8') as recipes_file:
+            for digest, recipe, error in parse_snapshots(snapshots, parser=parser, processes=processes):
+                if error:
+                    log(f'Snapshot {digest} is not read: {error}')
+                elif recipe:
+                    append_recipe(recipes_file, recipe)
+                    recipes_count += 1
+        os.replace(temporary_path, recipes_path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+    return recipes_count
+
+
+def terminate_last_line(path):
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return
+    with open(path, 'rb+') as file:
+        file.seek(-1, os.SEEK_END)
+        if file.read(1) != b'\n':
+            file.write(b'\n')
+
+
+def append_recipe(recipes_file, recipe):
+    recipes_file.write(json.dumps(recipe, ensure_ascii=False) + '\n')
+    recipes_file.flush()
+
+
+def read_recipes(recipes_path=RECIPES_FILE):
+    if recipes_path.endswith('.json'):
+        with open(recipes_path, 'r', encoding='utf-8') as file:
+            yield from json.load(file)
+        return
+
+    with open(recipes_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # the last line of an interrupted scrape may be cut off
+                continue
 
 
 class Command(BaseCommand):
@@ -249,6 +420,11 @@ class Command(BaseCommand):
             type=bool,
             help='Парсит рецепты с eda.ru',
         )
+        parser.add_argument(
+            '--reparse',
+            action='store_true',
+            help='Пересобирает файл рецептов из сохраненных страниц без загрузки',
+        )
         parser.add_argument(
             '--create',
             default=False,
@@ -264,18 +440,133 @@ class Command(BaseCommand):
             help='Записывает спискок ингердиентов',
         )
 
+        parser.add_argument(
+            '--images',
+            action='store_true',
+            help='Скачивает недостающие изображения блюд из рецептов файла',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Записывает рецепты пачками указанного размера',
+        )
+        parser.add_argument(
+            '--file',
+            default=RECIPES_FILE,
+            help='JSONL-файл с рецептами, по одному на строку',
+        )
+        parser.add_argument(
+            '--workers',
+            default=8,
+            type=int,
+            help='Число параллельных загрузок страниц и изображений',
+        )
+        parser.add_argument(
+            '--rate',
+            default=5,
+            type=float,
+            help='Максимум запросов в секунду при парсинге',
+        )
+        parser.add_argument(
+            '--retries',
+            default=3,
+            type=int,
+            help='Число повторов запроса при ошибке',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=CHECKPOINT_FILE,
+            help='Файл с уже обработанными страницами для продолжения парсинга',
+        )
+        parser.add_argument(
+            '--url-template',
+            default=RECIPE_URL_TEMPLATE,
+            help='Шаблон адреса рецепта с {number}',
+        )
+        parser.add_argument(
+            '--parser',
+            default=DEFAULT_PARSER_BACKEND,
+            choices=PARSER_BACKENDS,
+            help='Парсер страниц: полное дерево html.parser, только нужные узлы или lxml, если он установлен',
+        )
+        parser.add_argument(
+            '--snapshots',
+            default=SNAPSHOTS_DIRECTORY,
+            help='Каталог, куда сохраняются загруженные страницы',
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            help='Число процессов для --reparse, по умолчанию по числу ядер',
+        )
+        parser.add_argument(
+            '--first',
+            default=FIRST_RECIPE_NUMBER,
+            type=int,
+            help='Первый номер рецепта',
+        )
+        parser.add_argument(
+            '--last',
+            default=LAST_RECIPE_NUMBER,
+            type=int,
+            help='Номер рецепта, на котором парсинг останавливается',
+        )
+
     def handle(self, *args, **options):
         if options.get('parse'):
-            recipes = fill_recipes_json()
-            get_recipes_json_file(recipes)
+            recipes_count = fill_recipes_file(
+                recipes_path=options['file'],
+                url_template=options['url_template'],
+                numbers=range(options['first'], options['last']),
+                workers=options['workers'],
+                rate=options['rate'],
+                retries=options['retries'],
+                checkpoint_path=options['checkpoint'],
+                parser=options['parser'],
+                snapshots_directory=options['snapshots'],
+                log=self.stdout.write,
+            )
+            self.stdout.write(f'{recipes_count} recipes appended to {options["file"]}')
+        elif options['reparse']:
+            recipes_count = reparse_recipes_file(
+                recipes_path=options['file'],
+                snapshots_directory=options['snapshots'],
+                parser=options['parser'],
+                processes=options['processes'],
+                log=self.stdout.write,
+            )
+            self.stdout.write(f'{recipes_count} recipes written to {options["file"]}')
+        elif options['create'] and options['batch_size']:
+            dish_images, rejected = record_recipes_batch(
+                read_recipes(options['file']),
+                batch_size=options['batch_size'],
+                log=self.stdout.write,
+            )
+            for name, reason in rejected:
+                self.stdout.write(f'Rejected {name}: {reason}')
+            self.stdout.write(f'{len(dish_images)} recipes recorded, {len(rejected)} rejected')
+            self.download_images(dish_images, options)
         elif options['create']:
-            recipes = read_json()
-            for recipe in recipes:
-                record_recipe(recipe)
+            dish_images = []
+            for recipe in read_recipes(options['file']):
+                if dish := record_recipe(recipe):
+                    dish_images.append((dish.id, recipe['image']))
+            self.download_images(dish_images, options)
+        elif options['images']:
+            dish_images = get_missing_dish_images(read_recipes(options['file']))
+            self.download_images(dish_images, options)
         elif options['ing']:
-            recipes = read_json()
-            ingredients_and_quantity = [
+            ingredients_and_quantity = (
                 recipe['ingredients_and_quantity']
-                for recipe in recipes
-            ]
+                for recipe in read_recipes(options['file'])
+            )
             record_ingredients(ingredients_and_quantity)
+
+    def download_images(self, dish_images, options):
+        images_count = download_images(
+            dish_images,
+            workers=options['workers'],
+            retries=options['retries'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(f'{images_count} of {len(dish_images)} dish images attached')
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from cuisine.search import index_dishes, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of dishes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dish',
+            nargs='*',
+            type=int,
+            help='Переиндексирует только указанные блюда',
+        )
+        parser.add_argument(
+            '--batch-size',
+            default=1000,
+            type=int,
+            help='Число блюд в одной пачке документов',
+        )
+
+    def handle(self, *args, **options):
+        if options['dish']:
+            indexed_count = index_dishes(options['dish'])
+        else:
+            indexed_count = rebuild_search_index(batch_size=options['batch_size'])
+        self.stdout.write(f'Indexed {indexed_count} dishes')
@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from cuisine.images import generate_thumbnails
+from cuisine.models import Dish
+
+
+class Command(BaseCommand):
+    help = 'Generate missing thumbnails of dish images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--overwrite',
+            action='store_true',
+            help='Пересоздает уже существующие миниатюры',
+        )
+        parser.add_argument(
+            '--workers',
+            default=4,
+            type=int,
+            help='Число параллельно обрабатываемых изображений',
+        )
+
+    def handle(self, *args, **options):
+        image_names = set(Dish.objects.exclude(image='').values_list('image', flat=True))
+
+        thumbnails_count = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {
+                executor.submit(generate_thumbnails, image_name, default_storage, options['overwrite']): image_name
+                for image_name in image_names
+            }
+            for future in as_completed(futures):
+                try:
+                    thumbnails_count += future.result()
+                except OSError as error:
+                    self.stdout.write(f'Thumbnails of {futures[future]} are not generated: {error}')
+
+        self.stdout.write(f'{thumbnails_count} thumbnails generated for {len(image_names)} images')
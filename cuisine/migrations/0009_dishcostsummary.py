@@ -0,0 +1,26 @@
+# Generated by Django 3.2.6 on 2026-10-18 17:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cuisine', '0008_auto_20210829_0723'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DishCostSummary',
+            fields=[
+                ('dish', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='cost_summary', serialize=False, to='cuisine.dish', verbose_name='блюдо')),
+                ('total_price', models.FloatField(default=0, verbose_name='стоимость')),
+                ('ingredients', models.JSONField(default=list, help_text='список [id ингредиента, количество, стоимость]', verbose_name='ингредиенты')),
+            ],
+            options={
+                'verbose_name': 'сводка стоимости блюда',
+                'verbose_name_plural': 'сводки стоимости блюд',
+            },
+        ),
+    ]
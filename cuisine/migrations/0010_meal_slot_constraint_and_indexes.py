@@ -0,0 +1,45 @@
+# Generated by Django 3.2.6 on 2026-10-18 17:48
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_meals(apps, schema_editor):
+    Meal = apps.get_model('cuisine', 'Meal')
+    duplicate_slots = (
+        Meal.objects
+        .values('customer_id', 'date', 'meal_type')
+        .annotate(first_meal_id=Min('id'), meals_count=Count('id'))
+        .filter(meals_count__gt=1)
+    )
+    for slot in duplicate_slots:
+        (
+            Meal.objects
+            .filter(customer_id=slot['customer_id'], date=slot['date'], meal_type=slot['meal_type'])
+            .exclude(id=slot['first_meal_id'])
+            .delete()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cuisine', '0009_dishcostsummary'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_meals, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='name',
+            field=models.CharField(db_index=True, max_length=50, verbose_name='название'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredientposition',
+            index=models.Index(fields=['dish', 'ingredient'], name='ingredientposition_dish_ingr'),
+        ),
+        migrations.AddConstraint(
+            model_name='meal',
+            constraint=models.UniqueConstraint(fields=('customer', 'date', 'meal_type'), name='unique_meal_slot'),
+        ),
+    ]
@@ -0,0 +1,89 @@
+from django.db import migrations
+
+# the DDL mirrors cuisine.search as it was when the index was added, so later changes there don't change this migration
+SEARCH_TABLE = 'cuisine_dish_search'
+
+
+def get_search_documents_sql(apps, aggregate_function):
+    # dish id, name, space separated ingredient names and recipe of every dish
+    Dish = apps.get_model('cuisine', 'Dish')
+    Ingredient = apps.get_model('cuisine', 'Ingredient')
+    IngredientPosition = apps.get_model('cuisine', 'IngredientPosition')
+    dish_id = f'dish.{Dish._meta.pk.column}'
+    ingredient_id = f'ingredient.{Ingredient._meta.pk.column}'
+    position_dish_id = f'ingredient_position.{IngredientPosition._meta.get_field("dish").column}'
+    position_ingredient_id = f'ingredient_position.{IngredientPosition._meta.get_field("ingredient").column}'
+    ingredient_names = (
+        f"SELECT {aggregate_function}(ingredient.{Ingredient._meta.get_field('name').column}, ' ') "
+        f'FROM {IngredientPosition._meta.db_table} ingredient_position '
+        f'JOIN {Ingredient._meta.db_table} ingredient ON {ingredient_id} = {position_ingredient_id} '
+        f'WHERE {position_dish_id} = {dish_id}'
+    )
+    return (
+        f"SELECT {dish_id}, dish.{Dish._meta.get_field('name').column}, COALESCE(({ingredient_names}), ''), "
+        f"dish.{Dish._meta.get_field('recipe').column} FROM {Dish._meta.db_table} dish"
+    )
+
+
+def create_sqlite_search_index(apps, cursor):
+    cursor.execute(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} '
+        f'USING fts5(name, ingredients, recipe, tokenize = "unicode61 remove_diacritics 2")'
+    )
+    cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+    cursor.execute(
+        f'INSERT INTO {SEARCH_TABLE} (rowid, name, ingredients, recipe) '
+        f'{get_search_documents_sql(apps, "group_concat")}'
+    )
+
+
+def create_postgres_search_index(apps, cursor):
+    Dish = apps.get_model('cuisine', 'Dish')
+    cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+        f'dish_id bigint PRIMARY KEY REFERENCES {Dish._meta.db_table} ({Dish._meta.pk.column}) '
+        f'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+        f'document tsvector NOT NULL)'
+    )
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document ON {SEARCH_TABLE} USING gin (document)')
+    cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+    cursor.execute(
+        f'INSERT INTO {SEARCH_TABLE} (dish_id, document) '
+        f"SELECT dish_id, setweight(to_tsvector('russian', name), 'A') || "
+        f"setweight(to_tsvector('russian', ingredients), 'B') || "
+        f"setweight(to_tsvector('russian', recipe), 'D') "
+        f'FROM ({get_search_documents_sql(apps, "string_agg")}) '
+        f'AS documents (dish_id, name, ingredients, recipe)'
+    )
+
+
+SEARCH_INDEX_BUILDERS = {
+    'sqlite': create_sqlite_search_index,
+    'postgresql': create_postgres_search_index,
+}
+
+
+def create_search_index(apps, schema_editor):
+    create_index = SEARCH_INDEX_BUILDERS.get(schema_editor.connection.vendor)
+    if create_index is None:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        create_index(apps, cursor)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor not in SEARCH_INDEX_BUILDERS:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cuisine', '0010_meal_slot_constraint_and_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
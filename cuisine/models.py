@@ -35,6 +35,7 @@ class Tag(models.Model):
     name = models.CharField(
         'название',
         max_length=50,
+        db_index=True,
     )
     dishes = models.ManyToManyField(
         Dish,
@@ -98,6 +99,9 @@ class IngredientPosition(models.Model):
     class Meta:
         verbose_name = 'позиция ингредиентов блюда'
         verbose_name_plural = 'позиции ингредиентов блюда'
+        indexes = [
+            models.Index(fields=['dish', 'ingredient'], name='ingredientposition_dish_ingr'),
+        ]
 
     def __str__(self):
         return self.ingredient.name
@@ -131,6 +135,9 @@ class Meal(models.Model):
     class Meta:
         verbose_name = 'прием пищи'
         verbose_name_plural = 'приемы пищи'
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'date', 'meal_type'], name='unique_meal_slot'),
+        ]
 
     def __str__(self):
         return f'{self.get_meal_type_display().title()} {self.date} {self.customer.username}'
@@ -162,3 +169,29 @@ class MealPosition(models.Model):
 
     def __str__(self):
         return self.dish.name
+
+
+class DishCostSummary(models.Model):
+    dish = models.OneToOneField(
+        Dish,
+        verbose_name='блюдо',
+        related_name='cost_summary',
+        on_delete=models.CASCADE,
+        primary_key=True,
+    )
+    total_price = models.FloatField(
+        'стоимость',
+        default=0,
+    )
+    ingredients = models.JSONField(
+        'ингредиенты',
+        help_text='список [id ингредиента, количество, стоимость]',
+        default=list,
+    )
+
+    class Meta:
+        verbose_name = 'сводка стоимости блюда'
+        verbose_name_plural = 'сводки стоимости блюд'
+
+    def __str__(self):
+        return f'{self.dish_id}: {self.total_price:.2f}'
@@ -0,0 +1,156 @@
+import datetime
+import random
+from array import array
+from collections import Counter
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from cuisine.caching import ProcessCache
+from cuisine.dish_pool import get_dish_pool
+from cuisine.models import DishCostSummary, Meal
+
+Slot = Tuple[datetime.date, str]
+
+
+@dataclass
+class DishCatalog:
+    dish_ids: Dict[str, array]
+    costs: Dict[int, float]
+    ingredients: Dict[int, FrozenSet[int]]
+    cheapest_dish_ids: Dict[str, List[int]] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.cheapest_dish_ids = {
+            meal_type: sorted(dish_ids, key=lambda dish_id: self.costs.get(dish_id, 0))
+            for meal_type, dish_ids in self.dish_ids.items()
+        }
+
+    def get_cost(self, dish_id: int) -> float:
+        return self.costs.get(dish_id, 0)
+
+    def get_ingredients(self, dish_id: int) -> FrozenSet[int]:
+        return self.ingredients.get(dish_id, frozenset())
+
+
+def load_dish_catalog() -> DishCatalog:
+    dish_ids = {meal_type: get_dish_pool(tag_name) for meal_type, tag_name in Meal.MEAL_TYPES}
+    costs = {}
+    ingredients = {}
+    summaries = DishCostSummary.objects.values_list('dish_id', 'total_price', 'ingredients')
+    for dish_id, total_price, dish_ingredients in summaries.iterator():
+        costs[dish_id] = total_price
+        ingredients[dish_id] = frozenset(ingredient_id for ingredient_id, _, _ in dish_ingredients)
+    return DishCatalog(dish_ids=dish_ids, costs=costs, ingredients=ingredients)
+
+
+_dish_catalog: ProcessCache[DishCatalog] = ProcessCache(load_dish_catalog)
+
+
+def get_dish_catalog() -> DishCatalog:
+    return _dish_catalog.get()
+
+
+def invalidate_dish_catalog() -> None:
+    _dish_catalog.invalidate()
+
+
+class MenuPlanner:
+    """Подбирает блюда на слоты меню с учетом бюджета, повторов и общих ингредиентов.
+
+    Для каждого слота оценивается случайная выборка блюд: блюдо должно укладываться в оставшийся
+    бюджет и не повторяться чаще, чем раз в no_repeat_days дней, а из подходящих выбирается то,
+    что добавляет в список покупок меньше новых ингредиентов.
+    """
+
+    def __init__(
+            self,
+            catalog: DishCatalog,
+            max_weekly_cost: Optional[float] = None,
+            no_repeat_days: int = 7,
+            overlap_weight: float = 1.0,
+            candidates_count: int = 64,
+            randomizer: random.Random = None,
+    ):
+        self.catalog = catalog
+        self.max_weekly_cost = max_weekly_cost
+        self.no_repeat_days = no_repeat_days
+        self.overlap_weight = overlap_weight
+        self.candidates_count = candidates_count
+        self.randomizer = randomizer or random.Random()
+
+    def get_budget(self, days_count: int, planned_dish_ids: Sequence[int]) -> Optional[float]:
+        if self.max_weekly_cost is None:
+            return None
+        planned_cost = sum(self.catalog.get_cost(dish_id) for dish_id in planned_dish_ids)
+        return self.max_weekly_cost * days_count / 7 - planned_cost
+
+    def plan(
+            self,
+            slots: Sequence[Slot],
+            eaten_dishes: Sequence[Tuple[datetime.date, int]] = (),
+            budget: Optional[float] = None,
+    ) -> Dict[Slot, int]:
+        last_dates = {}
+        shopping_list = set()
+        for date, dish_id in eaten_dishes:
+            last_dates.setdefault(dish_id, []).append(date)
+            shopping_list |= self.catalog.get_ingredients(dish_id)
+
+        slots = sorted(slots)
+        remaining_slots_counts = Counter(meal_type for _, meal_type in slots)
+        plan = {}
+        for date, meal_type in slots:
+            remaining_slots_counts[meal_type] -= 1
+            max_cost = None
+            if budget is not None:
+                # the budget always keeps enough for the cheapest allowed dishes of the remaining slots
+                max_cost = budget - self._get_min_cost(date, remaining_slots_counts, last_dates)
+            dish_id = self._pick_dish(date, meal_type, last_dates, shopping_list, max_cost)
+            plan[(date, meal_type)] = dish_id
+            last_dates.setdefault(dish_id, []).append(date)
+            shopping_list |= self.catalog.get_ingredients(dish_id)
+            if budget is not None:
+                budget -= self.catalog.get_cost(dish_id)
+        return plan
+
+    def _get_min_cost(self, date, slots_counts, last_dates) -> float:
+        min_cost = 0
+        for meal_type, slots_count in slots_counts.items():
+            allowed_dish_ids = (
+                dish_id
+                for dish_id in self.catalog.cheapest_dish_ids[meal_type]
+                if not self._is_repeated(dish_id, date, last_dates)
+            )
+            min_cost += sum(self.catalog.get_cost(dish_id) for dish_id in islice(allowed_dish_ids, slots_count))
+        return min_cost
+
+    def _is_repeated(self, dish_id: int, date: datetime.date, last_dates: Dict[int, List[datetime.date]]) -> bool:
+        return any(abs((date - eaten_at).days) < self.no_repeat_days for eaten_at in last_dates.get(dish_id, ()))
+
+    def _pick_dish(self, date, meal_type, last_dates, shopping_list, max_cost) -> int:
+        dish_ids = self.catalog.dish_ids[meal_type]
+        candidate_indexes = self.randomizer.sample(range(len(dish_ids)), k=min(self.candidates_count, len(dish_ids)))
+
+        best_dish_id = None
+        best_score = None
+        for candidate_index in candidate_indexes:
+            dish_id = dish_ids[candidate_index]
+            if max_cost is not None and self.catalog.get_cost(dish_id) > max_cost:
+                continue
+            if self._is_repeated(dish_id, date, last_dates):
+                continue
+            ingredients = self.catalog.get_ingredients(dish_id)
+            shared_count = len(ingredients & shopping_list)
+            score = self.overlap_weight * shared_count - (len(ingredients) - shared_count)
+            if best_score is None or score > best_score:
+                best_dish_id, best_score = dish_id, score
+        if best_dish_id is not None:
+            return best_dish_id
+
+        # no sampled dish fits, so the cheapest one that is not repeated wins
+        cheapest_dish_ids = self.catalog.cheapest_dish_ids[meal_type]
+        for dish_id in cheapest_dish_ids:
+            if not self._is_repeated(dish_id, date, last_dates):
+                return dish_id
+        return cheapest_dish_ids[0]
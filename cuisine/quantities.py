@@ -0,0 +1,117 @@
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+VULGAR_FRACTIONS = {char: unicodedata.numeric(char) for char in '½⅓⅔¼¾⅕⅖⅗⅘⅙⅚⅐⅛⅜⅝⅞⅑⅒'}
+
+
+def _amount_pattern(prefix: str) -> str:
+    # "300", "1,5", "½", "1 ½", "1/2", "1 1/2" and "1⁄2" with the fraction slash
+    return (
+        rf'(?:(?P<{prefix}whole>\d+(?:[.,]\d+)?)\s*)?'
+        rf'(?:(?P<{prefix}numerator>\d+)\s*[/⁄]\s*(?P<{prefix}denominator>\d+)'
+        rf'|(?P<{prefix}vulgar>[{"".join(VULGAR_FRACTIONS)}]))'
+        rf'|(?P<{prefix}number>\d+(?:[.,]\d+)?)'
+    )
+
+
+QUANTITY_PATTERN = re.compile(
+    rf'\s*(?:(?:{_amount_pattern("")})(?:\s*[-–—]\s*(?:{_amount_pattern("upper_")}))?)?\s*(?P<units>.*?)\s*',
+    re.DOTALL,
+)
+
+# canonical units and the factor to them, looked up by the whole units string first
+UNIT_ALIASES = {
+    'г': ('г', 1),
+    'гр': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+    'шт': ('штука', 1),
+    'ст л': ('ст л', 1),
+    'ч л': ('ч л', 1),
+    # contains the stem of кусок
+    'по вкусу': ('по вкусу', 1),
+}
+# then by the first stem the units contain, so every grammatical form of a unit maps to it
+UNIT_STEMS = (
+    # abbreviated spoons like "ст. ложки" and "ч. ложка"
+    ('ст лож', 'ст л', 1),
+    ('ч лож', 'ч л', 1),
+    ('штук', 'штука', 1),
+    ('стол', 'ст л', 1),
+    ('чай', 'ч л', 1),
+    ('голов', 'головка', 1),
+    ('пуч', 'пучок', 1),
+    ('стакан', 'стакан', 1),
+    ('зубч', 'зубчик', 1),
+    ('стеб', 'стебель', 1),
+    ('веточ', 'веточка', 1),
+    ('упаков', 'упаковка', 1),
+    ('пакет', 'пакетик', 1),
+    ('кус', 'кусок', 1),
+    ('бан', 'банка', 1),
+    ('килограмм', 'г', 1000),
+    ('грамм', 'г', 1),
+    ('миллилитр', 'мл', 1),
+    ('литр', 'мл', 1000),
+)
+
+
+@lru_cache(maxsize=1024)
+def normalize_units(units: str) -> Tuple[str, float]:
+    units = re.sub(r'[\s.]+', ' ', units.lower()).strip()
+    if units in UNIT_ALIASES:
+        return UNIT_ALIASES[units]
+    for stem, canonical_units, factor in UNIT_STEMS:
+        if stem in units:
+            return canonical_units, factor
+    return units, 1
+
+
+def _get_amount(groups: Dict[str, Optional[str]], prefix: str = '') -> Optional[float]:
+    number = groups[prefix + 'number']
+    if number is not None:
+        return float(number.replace(',', '.'))
+
+    vulgar = groups[prefix + 'vulgar']
+    numerator = groups[prefix + 'numerator']
+    if vulgar is None and numerator is None:
+        return None
+    whole = groups[prefix + 'whole']
+    amount = float(whole.replace(',', '.')) if whole else 0
+    if vulgar is not None:
+        return amount + VULGAR_FRACTIONS[vulgar]
+    denominator = int(groups[prefix + 'denominator'])
+    if not denominator:
+        raise ValueError(f'Zero denominator in {numerator}/{denominator}')
+    return amount + int(numerator) / denominator
+
+
+@lru_cache(maxsize=8192)
+def parse_quantity(quantity_with_units: str) -> Tuple[float, str]:
+    """Количество в нормализованных единицах: «1 ½ стакана» → (1.5, 'стакан'), «1 кг» → (1000.0, 'г').
+
+    Без числа, как «по вкусу», количество равно 0.
+    """
+    groups = QUANTITY_PATTERN.fullmatch(quantity_with_units).groupdict()
+    units, factor = normalize_units(groups['units'])
+    # a range is bought by its upper bound, so the shopping list never falls short
+    amount = _get_amount(groups, 'upper_')
+    if amount is None:
+        amount = _get_amount(groups)
+    if amount is None:
+        return 0, units
+    return amount * factor, units
+
+
+def parse_quantities(quantities_with_units: Sequence[str], portions: Union[int, str]) -> List[Tuple[str, str]]:
+    portions = int(portions)
+    if portions <= 0:
+        raise ValueError(f'Quantities can not be divided into {portions} portions')
+    quantities = []
+    for quantity_with_units in quantities_with_units:
+        quantity, units = parse_quantity(quantity_with_units)
+        quantities.append((f'{quantity / portions:.3f}', units))
+    return quantities
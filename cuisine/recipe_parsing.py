@@ -0,0 +1,104 @@
+from typing import Callable, Dict, Optional
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from cuisine.quantities import parse_quantities
+
+try:
+    import lxml
+except ImportError:
+    lxml = None
+
+# classes of the eda.ru nodes that parse_recipe_soup reads, the name is the page's only h1
+IMAGE_CLASS = 'css-17zastc'
+TAGS_CLASS = 'css-a90bfp'
+INGREDIENT_CLASS = 'css-12s4kyf-Info'
+PORTIONS_AND_TIME_CLASS = 'css-1k7lmq6'
+QUANTITY_CLASS = 'css-1t5teuh-Info'
+STEP_CLASS = 'css-8repvw-Info'
+RECIPE_CLASSES = frozenset({
+    IMAGE_CLASS,
+    TAGS_CLASS,
+    INGREDIENT_CLASS,
+    PORTIONS_AND_TIME_CLASS,
+    QUANTITY_CLASS,
+    STEP_CLASS,
+})
+
+
+def is_recipe_node(name: str, attrs: Dict[str, str]) -> bool:
+    # the tree builders pass raw attributes here, before the class is split into a list
+    if name == 'h1':
+        return True
+    classes = attrs.get('class')
+    return bool(classes) and not RECIPE_CLASSES.isdisjoint(classes.split())
+
+
+RECIPE_NODES = SoupStrainer(is_recipe_node)
+
+
+def parse_full_tree(html: str) -> BeautifulSoup:
+    return BeautifulSoup(html, 'html.parser')
+
+
+def parse_recipe_nodes(html: str) -> BeautifulSoup:
+    # the rest of the page is still tokenized, but no tree is built for it
+    return BeautifulSoup(html, 'html.parser', parse_only=RECIPE_NODES)
+
+
+def parse_recipe_nodes_with_lxml(html: str) -> BeautifulSoup:
+    return BeautifulSoup(html, 'lxml', parse_only=RECIPE_NODES)
+
+
+PARSER_BACKENDS: Dict[str, Callable[[str], BeautifulSoup]] = {
+    'html.parser': parse_full_tree,
+    'strainer': parse_recipe_nodes,
+}
+if lxml is not None:
+    PARSER_BACKENDS['lxml'] = parse_recipe_nodes_with_lxml
+
+DEFAULT_PARSER_BACKEND = 'lxml' if lxml is not None else 'strainer'
+
+
+def parse_recipe_html(html: str, parser: Optional[str] = None) -> Optional[dict]:
+    soup = PARSER_BACKENDS[parser or DEFAULT_PARSER_BACKEND](html)
+    return parse_recipe_soup(soup)
+
+
+def parse_recipe_soup(soup: BeautifulSoup) -> Optional[dict]:
+    try:
+        image_url = soup.select_one(f'.{IMAGE_CLASS} .css-3uhzwz-ImageBase img').get('src')
+    except AttributeError:
+        return None
+
+    name = soup.h1.text.replace('\xa0', ' ')
+    tags = list(soup.find(class_=TAGS_CLASS).stripped_strings)
+
+    ingredients = [ingredient.text for ingredient in soup.find_all(class_=INGREDIENT_CLASS)]
+
+    portion_and_time = list(soup.find(class_=PORTIONS_AND_TIME_CLASS).stripped_strings)
+    portions = portion_and_time[1]
+    cooking_time = portion_and_time[-1]
+    # quantities are stored per portion, so a page without portions has nothing to store
+    if not portions.isdigit() or not int(portions):
+        return None
+
+    quantities = parse_quantities([layout.text for layout in soup.find_all(class_=QUANTITY_CLASS)], portions)
+
+    if not quantities:
+        return None
+
+    ingredients_and_quantity = dict(zip(ingredients, quantities))
+
+    recipe_steps = [step.text for step in soup.find_all(class_=STEP_CLASS)]
+    recipe = '\n'.join(recipe_steps).replace('\xa0', ' ')
+
+    dish_recipe = {
+        'name': name,
+        'tags': tags,
+        'ingredients_and_quantity': ingredients_and_quantity,
+        'cooking_time': cooking_time,
+        'recipe': recipe,
+        'image': image_url,
+    }
+    return dish_recipe
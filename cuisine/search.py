@@ -0,0 +1,219 @@
+import re
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from django.db import NotSupportedError, connection
+from django.db.models import QuerySet
+from django.db.models.expressions import RawSQL
+
+from cuisine.dish_pool import fetch_dishes
+from cuisine.models import Dish, IngredientPosition
+from cuisine.transactions import write_transaction
+
+SEARCH_TABLE = 'cuisine_dish_search'
+
+# dish id, name, ingredient names, recipe
+SearchDocument = Tuple[int, str, str, str]
+
+
+class SqliteSearchBackend:
+    """Индекс FTS5, строка которого хранится под rowid блюда."""
+
+    # bm25 weights of the name, ingredients and recipe columns
+    WEIGHTS = (10.0, 4.0, 1.0)
+
+    def create_table(self, cursor) -> None:
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} '
+            f'USING fts5(name, ingredients, recipe, tokenize = "unicode61 remove_diacritics 2")'
+        )
+
+    def delete(self, cursor, dish_ids: Optional[List[int]] = None) -> None:
+        if dish_ids is None:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+            return
+        for chunk in _chunked(dish_ids, 500):
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({", ".join(["%s"] * len(chunk))})', chunk,
+            )
+
+    def insert(self, cursor, documents: List[SearchDocument]) -> None:
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, ingredients, recipe) VALUES (%s, %s, %s, %s)', documents,
+        )
+
+    def build_query(self, words: List[str]) -> str:
+        # only the last word is matched as a prefix, since it may be still being typed
+        *exact_words, last_word = words
+        return ' '.join([*(f'"{word}"' for word in exact_words), f'"{last_word}"*'])
+
+    def get_matching_ids_sql(self, query: str) -> Tuple[str, list]:
+        return f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [query]
+
+    def get_ranked_ids_sql(self, query: str, limit: int, offset: int) -> Tuple[str, list]:
+        weights = ', '.join(map(str, self.WEIGHTS))
+        return (
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+            f'ORDER BY bm25({SEARCH_TABLE}, {weights}), rowid LIMIT %s OFFSET %s',
+            [query, limit, offset],
+        )
+
+
+class PostgresSearchBackend:
+    """Таблица с tsvector блюда и GIN-индексом, веса A, B и D у названия, ингредиентов и рецепта."""
+
+    CONFIG = 'russian'
+
+    def create_table(self, cursor) -> None:
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+            f'dish_id bigint PRIMARY KEY REFERENCES cuisine_dish (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            f'document tsvector NOT NULL)'
+        )
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document ON {SEARCH_TABLE} USING gin (document)')
+
+    def delete(self, cursor, dish_ids: Optional[List[int]] = None) -> None:
+        if dish_ids is None:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        else:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE dish_id = ANY(%s)', [list(dish_ids)])
+
+    def insert(self, cursor, documents: List[SearchDocument]) -> None:
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (dish_id, document) VALUES (%s, '
+            f"setweight(to_tsvector('{self.CONFIG}', %s), 'A') || "
+            f"setweight(to_tsvector('{self.CONFIG}', %s), 'B') || "
+            f"setweight(to_tsvector('{self.CONFIG}', %s), 'D'))",
+            documents,
+        )
+
+    def build_query(self, words: List[str]) -> str:
+        *exact_words, last_word = words
+        return ' & '.join([*exact_words, f'{last_word}:*'])
+
+    def get_matching_ids_sql(self, query: str) -> Tuple[str, list]:
+        return (
+            f"SELECT dish_id FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('{self.CONFIG}', %s)",
+            [query],
+        )
+
+    def get_ranked_ids_sql(self, query: str, limit: int, offset: int) -> Tuple[str, list]:
+        return (
+            f"SELECT dish_id FROM {SEARCH_TABLE}, to_tsquery('{self.CONFIG}', %s) query "
+            f'WHERE document @@ query ORDER BY ts_rank(document, query) DESC, dish_id LIMIT %s OFFSET %s',
+            [query, limit, offset],
+        )
+
+
+SEARCH_BACKENDS = {
+    'sqlite': SqliteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend():
+    try:
+        return SEARCH_BACKENDS[connection.vendor]()
+    except KeyError:
+        raise NotSupportedError(f'Full-text search is not supported on {connection.vendor}')
+
+
+def _chunked(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def iter_search_documents(
+        dish_ids: Optional[Iterable[int]] = None,
+        batch_size: int = 1000,
+) -> Iterator[List[SearchDocument]]:
+    dishes = Dish.objects.order_by('id').values_list('id', 'name', 'recipe')
+    if dish_ids is not None:
+        dishes = dishes.filter(id__in=set(dish_ids))
+    for dishes_chunk in _chunked(dishes.iterator(), batch_size):
+        ingredient_names = {}
+        positions = IngredientPosition.objects.filter(
+            dish_id__in=[dish_id for dish_id, _, _ in dishes_chunk],
+        ).values_list('dish_id', 'ingredient__name')
+        for dish_id, ingredient_name in positions:
+            ingredient_names.setdefault(dish_id, []).append(ingredient_name)
+        yield [
+            (dish_id, name, ' '.join(ingredient_names.get(dish_id, ())), recipe)
+            for dish_id, name, recipe in dishes_chunk
+        ]
+
+
+@write_transaction()
+def index_dishes(dish_ids: Iterable[int]) -> int:
+    dish_ids = list(set(dish_ids))
+    backend = get_search_backend()
+    indexed_count = 0
+    with connection.cursor() as cursor:
+        backend.delete(cursor, dish_ids)
+        # deleted dishes have no documents and just drop out of the index
+        for documents in iter_search_documents(dish_ids):
+            backend.insert(cursor, documents)
+            indexed_count += len(documents)
+    return indexed_count
+
+
+@write_transaction()
+def rebuild_search_index(batch_size: int = 1000) -> int:
+    backend = get_search_backend()
+    indexed_count = 0
+    with connection.cursor() as cursor:
+        backend.create_table(cursor)
+        backend.delete(cursor)
+        for documents in iter_search_documents(batch_size=batch_size):
+            backend.insert(cursor, documents)
+            indexed_count += len(documents)
+    return indexed_count
+
+
+def get_search_words(query: str) -> List[str]:
+    return re.findall(r'\w+', query.lower())
+
+
+def filter_dishes(queryset: QuerySet, query: str) -> QuerySet:
+    words = get_search_words(query)
+    if not words:
+        return queryset.none()
+    backend = get_search_backend()
+    sql, params = backend.get_matching_ids_sql(backend.build_query(words))
+    return queryset.filter(id__in=RawSQL(sql, params))
+
+
+class DishSearchResults:
+    """Ленивый список найденных блюд по релевантности, который понимает Paginator."""
+
+    def __init__(self, query: str):
+        self.backend = get_search_backend()
+        words = get_search_words(query)
+        self.query = self.backend.build_query(words) if words else None
+        self._count = None
+
+    def count(self) -> int:
+        if self._count is None:
+            if self.query is None:
+                self._count = 0
+            else:
+                sql, params = self.backend.get_matching_ids_sql(self.query)
+                with connection.cursor() as cursor:
+                    cursor.execute(f'SELECT count(*) FROM ({sql}) matches', params)
+                    self._count, = cursor.fetchone()
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, items: slice):
+        if self.query is None:
+            return []
+        offset = items.start or 0
+        sql, params = self.backend.get_ranked_ids_sql(self.query, items.stop - offset, offset)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            dish_ids = [dish_id for dish_id, in cursor.fetchall()]
+        # the index of a dish deleted in another process may not be updated yet
+        return [dish for dish in fetch_dishes(dish_ids) if dish is not None]
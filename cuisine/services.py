@@ -1,47 +1,159 @@
-import math
-import random
 import datetime
-from typing import List, Dict, Sequence
+from collections import Counter, defaultdict
+from typing import List, Dict, Mapping, Optional, Sequence, Tuple
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import F, Sum, Case, When, Value, FloatField, ExpressionWrapper
+from django.db.models.functions import Cast, Coalesce
 
-from cuisine.models import MealPosition, Dish, Meal
+from cuisine.caching import WEEK_MENU_CACHE_TIMEOUT, get_week_menu_cache_key
+from cuisine.dish_costs import WEIGHT_UNITS, calculate_ingredient_price, rebuild_dish_cost_summaries
+from cuisine.dish_pool import choose_dishes, sample_dish_ids
+from cuisine.images import get_thumbnail_urls
+from cuisine.ingredient_matrix import get_ingredient_matrix, is_ingredient_matrix_available
+from cuisine.planner import MenuPlanner
+from cuisine.transactions import write_transaction
+from cuisine.models import MealPosition, Dish, Meal, DishCostSummary, Ingredient, IngredientPosition
 
 
-def regenerate_and_save_menu(user: User):
-    meals = Meal.objects.filter(customer=user)
-    all_dishes = Dish.objects.prefetch_related('tags')
+def regenerate_and_save_menu(user: User, days_count: int = 7) -> int:
+    return fill_missing_meals([user.id], generate_dates_from_today(days_count=days_count))
 
-    for meal_type in Meal.MEAL_TYPES:
-        meal_type_dishes = all_dishes.filter(tags__name=meal_type[1]).all()
-        meal_type_dishes = _get_random_dishes(meal_type_dishes, count=7)
 
-        for i, date in enumerate(generate_dates_from_today(days_count=7)):
-            if meals.filter(date=date, meal_type=meal_type[0]).exists():
-                continue
+def fill_missing_meals(
+        user_ids: Sequence[int],
+        dates: List[datetime.date],
+        planner: Optional[MenuPlanner] = None,
+) -> int:
+    existing_slots = set(
+        Meal.objects
+        .filter(customer_id__in=user_ids, date__in=dates)
+        .values_list('customer_id', 'date', 'meal_type')
+    )
+    missing_slots = [
+        (user_id, date, meal_type)
+        for user_id in user_ids
+        for meal_type, _ in Meal.MEAL_TYPES
+        for date in dates
+        if (user_id, date, meal_type) not in existing_slots
+    ]
+    if not missing_slots:
+        return 0
+
+    if planner is None:
+        slot_dish_ids = _pick_random_dishes(dates, missing_slots)
+    else:
+        slot_dish_ids = _plan_dishes(dates, missing_slots, planner)
+
+    # menus are planned before the write lock is taken, so parallel workers only wait for each other's inserts
+    with write_transaction():
+        # a concurrent request may have filled the same slots, unique_meal_slot keeps the meals single
+        Meal.objects.bulk_create([
+            Meal(meal_type=meal_type, date=date, customer_id=user_id)
+            for user_id, date, meal_type in missing_slots
+        ], ignore_conflicts=True)
+        # SQLite doesn't return primary keys from bulk inserts, so the new meals are fetched back.
+        # Meals that got their dish from the concurrent request are skipped, so they are not filled twice
+        new_meals = Meal.objects.filter(
+            customer_id__in={user_id for user_id, _, _ in missing_slots},
+            date__in={date for _, date, _ in missing_slots},
+            meal_positions__isnull=True,
+        ).values_list('id', 'customer_id', 'date', 'meal_type')
+        meal_positions = [
+            MealPosition(meal_id=meal_id, dish_id=slot_dish_ids[(user_id, date, meal_type)], quantity=1)
+            for meal_id, user_id, date, meal_type in new_meals
+            if (user_id, date, meal_type) not in existing_slots
+        ]
+        MealPosition.objects.bulk_create(meal_positions)
+    return len(meal_positions)
+
+
+def _pick_random_dishes(dates: List[datetime.date], missing_slots: List[tuple]) -> Dict[tuple, int]:
+    missing_user_meal_types = {(user_id, meal_type) for user_id, _, meal_type in missing_slots}
+    slot_dish_ids = {}
+    for user_id, meal_type in missing_user_meal_types:
+        random_dish_ids = sample_dish_ids(dict(Meal.MEAL_TYPES)[meal_type], count=len(dates))
+        slot_dish_ids.update({
+            (user_id, date, meal_type): dish_id
+            for date, dish_id in zip(dates, random_dish_ids)
+        })
+    return slot_dish_ids
+
+
+def _plan_dishes(dates: List[datetime.date], missing_slots: List[tuple], planner: MenuPlanner) -> Dict[tuple, int]:
+    user_slots = defaultdict(list)
+    for user_id, date, meal_type in missing_slots:
+        user_slots[user_id].append((date, meal_type))
+
+    eaten_dishes = defaultdict(list)
+    meal_positions = MealPosition.objects.filter(
+        meal__customer_id__in=user_slots,
+        meal__date__gte=min(dates) - datetime.timedelta(days=planner.no_repeat_days),
+        meal__date__lte=max(dates),
+    ).values_list('meal__customer_id', 'meal__date', 'dish_id')
+    for user_id, date, dish_id in meal_positions:
+        eaten_dishes[user_id].append((date, dish_id))
 
-            meal = Meal.objects.create(meal_type=meal_type[0], date=date, customer=user)
-            meal.save()
+    slot_dish_ids = {}
+    for user_id, slots in user_slots.items():
+        planned_dish_ids = [dish_id for date, dish_id in eaten_dishes[user_id] if date in dates]
+        budget = planner.get_budget(len(dates), planned_dish_ids)
+        plan = planner.plan(slots, eaten_dishes[user_id], budget)
+        slot_dish_ids.update({
+            (user_id, date, meal_type): dish_id
+            for (date, meal_type), dish_id in plan.items()
+        })
+    return slot_dish_ids
 
-            meal_position = MealPosition.objects.create(meal=meal, dish=meal_type_dishes[i], quantity=1)
-            meal_position.save()
 
+def serialize_week_menu(user: User, dates: List[datetime.date]) -> List[Tuple[datetime.date, List[dict]]]:
+    meals = (
+        Meal.objects
+        .filter(date__in=dates, customer=user)
+        .order_by('date')
+        .prefetch_related('meal_positions__dish')
+    )
+
+    serialized_meals = defaultdict(list)
+    for meal in meals:
+        dish = meal.meal_positions.all()[0].dish
+        serialized_meal = {
+            'id': dish.id,
+            'name': dish.name,
+            'thumbnails': get_thumbnail_urls(dish.image, 'grid'),
+            'meal_type': meal.get_meal_type_display(),
+        }
+        serialized_meals[meal.date].append(serialized_meal)
+    return list(serialized_meals.items())
+
+
+def get_week_menu(user: User, days_count: int = 7) -> List[Tuple[datetime.date, List[dict]]]:
+    dates = generate_dates_from_today(days_count=days_count)
+    cache_key = get_week_menu_cache_key(user.id, dates[0])
+    week_menu = cache.get(cache_key)
+    if week_menu is not None:
+        return week_menu
+
+    # after the day rolls over yesterday's snapshot still holds all days but the last one
+    previous_week_menu = cache.get(get_week_menu_cache_key(user.id, dates[0] - datetime.timedelta(days=1))) or []
+    week_menu = [(date, meals) for date, meals in previous_week_menu if date in dates]
+    cached_dates = {date for date, _ in week_menu}
 
-def _get_random_dishes(dishes: Sequence[Dish], count: int) -> List[Dish]:
-    dishes = list(dishes)
-    if len(dishes) < count:
-        batches_count = math.ceil(count / len(dishes))
-        dishes = dishes * batches_count
+    regenerate_and_save_menu(user, days_count=days_count)
+    week_menu.extend(serialize_week_menu(user, [date for date in dates if date not in cached_dates]))
+    week_menu.sort(key=lambda day: day[0])
 
-    return random.sample(dishes, k=count)
+    cache.set(cache_key, week_menu, timeout=WEEK_MENU_CACHE_TIMEOUT)
+    return week_menu
 
 
 def generate_daily_menu_randomly() -> Dict[str, Dish]:
-    dishes = Dish.objects.prefetch_related('tags')
+    breakfast, lunch, dinner = choose_dishes(['завтрак', 'обед', 'ужин'])
     random_menu = {
-        'breakfast': random.choice(dishes.filter(tags__name='завтрак')),
-        'lunch': random.choice(dishes.filter(tags__name='обед')),
-        'dinner': random.choice(dishes.filter(tags__name='ужин')),
+        'breakfast': breakfast,
+        'lunch': lunch,
+        'dinner': dinner,
     }
     return random_menu
 
@@ -59,11 +171,13 @@ def aggregate_ingredients(user: User, weekdays: List[datetime.date]) -> List[Dic
         'meal_positions__dish__positions__quantity',
         'meal_positions__dish__positions__ingredient__units',
         'meal_positions__dish__positions__ingredient__price',
+        'meal_positions__quantity',
     )
 
     _aggregated_ingredients = {}
-    for name, quantity, units_name, price_per_unit in ingredients:
-        price_per_unit = float(price_per_unit) if price_per_unit is not None else 0
+    for name, quantity, units_name, price_per_unit, dishes_count in ingredients:
+        if name is None:
+            continue
 
         if name not in _aggregated_ingredients:
             _aggregated_ingredients[name] = {
@@ -72,11 +186,93 @@ def aggregate_ingredients(user: User, weekdays: List[datetime.date]) -> List[Dic
                 'total_price': 0,
             }
 
-        _aggregated_ingredients[name]['total_quantity'] += quantity
-
-        ingredient_price = quantity * price_per_unit
-        if units_name == 'г' or units_name == 'мл':
-            ingredient_price /= 1000
-        _aggregated_ingredients[name]['total_price'] += ingredient_price
+        _aggregated_ingredients[name]['total_quantity'] += quantity * dishes_count
+        ingredient_price = calculate_ingredient_price(quantity, units_name, price_per_unit)
+        _aggregated_ingredients[name]['total_price'] += ingredient_price * dishes_count
 
     return [dict({'name': name}, **aggregated_info) for name, aggregated_info in _aggregated_ingredients.items()]
+
+
+def aggregate_ingredients_in_db(user: User, weekdays: List[datetime.date]) -> List[Dict[str, str]]:
+    dishes_count = F('dish__dish_positions__quantity')
+    total_quantity = ExpressionWrapper(F('quantity') * dishes_count, output_field=FloatField())
+    total_price = ExpressionWrapper(
+        total_quantity * Cast(Coalesce('ingredient__price', Value(0)), FloatField()),
+        output_field=FloatField(),
+    )
+    ingredients = (
+        IngredientPosition.objects
+        .filter(dish__dish_positions__meal__date__in=weekdays, dish__dish_positions__meal__customer=user)
+        .values('ingredient_id')
+        .annotate(
+            name=F('ingredient__name'),
+            units_name=F('ingredient__units'),
+            total_quantity=Sum(total_quantity),
+            total_price=Sum(
+                Case(
+                    When(ingredient__units__in=WEIGHT_UNITS, then=total_price / Value(1000.0)),
+                    default=total_price,
+                    output_field=FloatField(),
+                )
+            ),
+        )
+        .order_by()
+    )
+    return [
+        {
+            'name': ingredient['name'],
+            'total_quantity': ingredient['total_quantity'],
+            'units_name': ingredient['units_name'],
+            'total_price': ingredient['total_price'],
+        }
+        for ingredient in ingredients
+    ]
+
+
+def count_user_dishes(user: User, weekdays: List[datetime.date]) -> Counter:
+    dish_counts = Counter()
+    meal_positions = MealPosition.objects.filter(meal__date__in=weekdays, meal__customer=user)
+    for dish_id, quantity in meal_positions.values_list('dish_id', 'quantity'):
+        dish_counts[dish_id] += quantity
+    return dish_counts
+
+
+def aggregate_ingredients_from_matrix(user: User, weekdays: List[datetime.date]) -> List[Dict[str, str]]:
+    return aggregate_dish_counts(count_user_dishes(user, weekdays))
+
+
+def aggregate_dish_counts(dish_counts: Mapping[int, float]) -> List[Dict[str, str]]:
+    if not is_ingredient_matrix_available():
+        return aggregate_dish_counts_from_summaries(dish_counts)
+    return get_ingredient_matrix().aggregate(dish_counts)
+
+
+def aggregate_ingredients_from_summaries(user: User, weekdays: List[datetime.date]) -> List[Dict[str, str]]:
+    return aggregate_dish_counts_from_summaries(count_user_dishes(user, weekdays))
+
+
+def aggregate_dish_counts_from_summaries(dish_counts: Mapping[int, float]) -> List[Dict[str, str]]:
+    summaries = dict(DishCostSummary.objects.filter(dish_id__in=dish_counts).values_list('dish_id', 'ingredients'))
+    missing_dish_ids = dish_counts.keys() - summaries.keys()
+    if missing_dish_ids:
+        rebuild_dish_cost_summaries(missing_dish_ids)
+        summaries.update(
+            DishCostSummary.objects.filter(dish_id__in=missing_dish_ids).values_list('dish_id', 'ingredients')
+        )
+
+    _aggregated_ingredients = defaultdict(lambda: [0, 0])
+    for dish_id, dishes_count in dish_counts.items():
+        for ingredient_id, quantity, ingredient_price in summaries[dish_id]:
+            _aggregated_ingredients[ingredient_id][0] += quantity * dishes_count
+            _aggregated_ingredients[ingredient_id][1] += ingredient_price * dishes_count
+
+    ingredients = Ingredient.objects.in_bulk(_aggregated_ingredients)
+    return [
+        {
+            'name': ingredients[ingredient_id].name,
+            'total_quantity': total_quantity,
+            'units_name': ingredients[ingredient_id].units,
+            'total_price': total_price,
+        }
+        for ingredient_id, (total_quantity, total_price) in _aggregated_ingredients.items()
+    ]
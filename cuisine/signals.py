@@ -0,0 +1,136 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from cuisine.caching import bump_catalog_revision, invalidate_week_menu
+from cuisine.dish_costs import rebuild_dish_cost_summaries
+from cuisine.dish_pool import invalidate_dish_pools
+from cuisine.images import generate_thumbnails
+from cuisine.ingredient_index import invalidate_ingredient_index
+from cuisine.ingredient_matrix import invalidate_ingredient_matrix
+from cuisine.planner import invalidate_dish_catalog
+from cuisine.search import index_dishes
+from cuisine.models import Dish, Tag, Ingredient, IngredientPosition, Meal, MealPosition
+
+logger = logging.getLogger(__name__)
+
+
+# the in-process caches are reset after the commit, so no request reloads them from the data being replaced,
+# and the revision bump makes the other processes reload theirs
+def reset_dish_caches():
+    invalidate_dish_pools()
+    invalidate_dish_catalog()
+    bump_catalog_revision()
+
+
+def reset_ingredient_caches():
+    invalidate_ingredient_matrix()
+    invalidate_ingredient_index()
+    bump_catalog_revision()
+
+
+def reset_catalog_caches():
+    # for bulk inserts, which don't send the signals
+    invalidate_dish_pools()
+    invalidate_dish_catalog()
+    invalidate_ingredient_matrix()
+    invalidate_ingredient_index()
+    bump_catalog_revision()
+
+
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Dish)
+@receiver(post_save, sender=IngredientPosition)
+@receiver(post_delete, sender=IngredientPosition)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def reset_dish_pools(**kwargs):
+    transaction.on_commit(reset_dish_caches)
+
+
+@receiver(m2m_changed, sender=Tag.dishes.through)
+def reset_dish_pools_on_tags_change(action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(reset_dish_caches)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def reset_catalog_pages(**kwargs):
+    transaction.on_commit(reset_ingredient_caches)
+
+
+def refresh_cost_summaries(dish_ids):
+    rebuild_dish_cost_summaries(dish_ids)
+    # the costs are a part of the dish catalog, which other processes reload only after the revision changes
+    invalidate_dish_catalog()
+    bump_catalog_revision()
+
+
+@receiver(post_save, sender=IngredientPosition)
+@receiver(post_delete, sender=IngredientPosition)
+def refresh_dish_cost_summary(instance, **kwargs):
+    dish_id = instance.dish_id
+    transaction.on_commit(reset_ingredient_caches)
+    transaction.on_commit(lambda: refresh_cost_summaries([dish_id]))
+
+
+@receiver(post_save, sender=Ingredient)
+def refresh_ingredient_dishes_cost_summaries(instance, created, **kwargs):
+    if created:
+        return
+    dish_ids = set(instance.positions.values_list('dish_id', flat=True))
+    if dish_ids:
+        transaction.on_commit(lambda: refresh_cost_summaries(dish_ids))
+        # the ingredient name is a part of the dishes' search documents
+        transaction.on_commit(lambda: index_dishes(dish_ids))
+
+
+@receiver(post_save, sender=Dish)
+@receiver(post_delete, sender=Dish)
+@receiver(post_save, sender=IngredientPosition)
+@receiver(post_delete, sender=IngredientPosition)
+def refresh_search_index(sender, instance, **kwargs):
+    dish_id = instance.id if sender is Dish else instance.dish_id
+    transaction.on_commit(lambda: index_dishes([dish_id]))
+
+
+@receiver(post_save, sender=Dish)
+def create_dish_thumbnails(instance, **kwargs):
+    if not instance.image:
+        return
+    try:
+        generate_thumbnails(instance.image.name, storage=instance.image.storage)
+    except OSError as error:
+        logger.warning('Thumbnails of %s are not generated: %s', instance.image.name, error)
+
+
+@receiver(post_save, sender=Meal)
+@receiver(post_delete, sender=Meal)
+def reset_week_menu(instance, **kwargs):
+    customer_id = instance.customer_id
+    transaction.on_commit(lambda: invalidate_week_menu(customer_id))
+
+
+@receiver(post_save, sender=MealPosition)
+@receiver(post_delete, sender=MealPosition)
+def reset_week_menu_on_position_change(instance, **kwargs):
+    if MealPosition.meal.is_cached(instance):
+        customer_id = instance.meal.customer_id
+    else:
+        customer_id = Meal.objects.filter(id=instance.meal_id).values_list('customer_id', flat=True).first()
+    if customer_id is not None:
+        transaction.on_commit(lambda: invalidate_week_menu(customer_id))
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
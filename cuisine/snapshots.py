@@ -0,0 +1,107 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Dict, Iterator, Optional, Tuple
+
+from cuisine.recipe_parsing import parse_recipe_html
+
+SNAPSHOTS_DIRECTORY = 'snapshots'
+SNAPSHOT_INDEX = 'index.jsonl'
+
+
+def get_snapshot_path(directory: str, digest: str) -> str:
+    return os.path.join(directory, 'objects', digest[:2], f'{digest}.html.gz')
+
+
+def read_snapshot(directory: str, digest: str) -> str:
+    with gzip.open(get_snapshot_path(directory, digest), 'rt', encoding='utf-8') as file:
+        return file.read()
+
+
+class SnapshotStore:
+    """Сжатые gzip страницы, сохраненные по sha256 содержимого, и индекс адрес → sha256.
+
+    Индекс дописывается по строке на сохранение, так что при повторной загрузке адреса действует последняя строка.
+    """
+
+    def __init__(self, directory: str = SNAPSHOTS_DIRECTORY):
+        self.directory = directory
+        self.index_path = os.path.join(directory, SNAPSHOT_INDEX)
+        self.digests: Dict[str, str] = {}
+        self.lock = threading.Lock()
+
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, 'r', encoding='utf-8') as index_file:
+            for line in index_file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line of an interrupted scrape may be cut off
+                    continue
+                self.digests[entry['url']] = entry['sha256']
+
+    def __len__(self):
+        return len(self.digests)
+
+    def get(self, url: str) -> Optional[str]:
+        digest = self.digests.get(url)
+        return None if digest is None else read_snapshot(self.directory, digest)
+
+    def store(self, url: str, html: str) -> str:
+        content = html.encode('utf-8')
+        digest = hashlib.sha256(content).hexdigest()
+        path = get_snapshot_path(self.directory, digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # a crash mid-write must not leave a truncated page under its digest
+            file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(file_descriptor, 'wb') as file:
+                file.write(gzip.compress(content))
+            os.replace(temporary_path, path)
+
+        with self.lock:
+            if self.digests.get(url) != digest:
+                with open(self.index_path, 'a', encoding='utf-8') as index_file:
+                    index_file.write(json.dumps({'url': url, 'sha256': digest}) + '\n')
+                self.digests[url] = digest
+        return digest
+
+
+def parse_snapshot(
+        directory: str,
+        digest: str,
+        parser: Optional[str] = None,
+) -> Tuple[Optional[dict], Optional[str]]:
+    # runs in a worker process, which reads the page itself instead of receiving it pickled
+    try:
+        html = read_snapshot(directory, digest)
+    except (OSError, EOFError, UnicodeDecodeError) as error:
+        # a missing or corrupt object loses only its own page
+        return None, f'{type(error).__name__}: {error}'
+    try:
+        return parse_recipe_html(html, parser=parser), None
+    except (AttributeError, IndexError, ValueError):
+        return None, None
+
+
+def parse_snapshots(
+        store: SnapshotStore,
+        parser: Optional[str] = None,
+        processes: Optional[int] = None,
+        chunk_size: int = 8,
+) -> Iterator[Tuple[str, Optional[dict], Optional[str]]]:
+    """По каждой сохраненной странице: sha256, рецепт или None и ошибка чтения снимка, если он не прочитан."""
+    # pages with the same content are parsed once, recipes come in the order the pages were first stored
+    digests = list(dict.fromkeys(store.digests.values()))
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        results = executor.map(
+            parse_snapshot, repeat(store.directory), digests, repeat(parser), chunksize=chunk_size,
+        )
+        for digest, (recipe, error) in zip(digests, results):
+            yield digest, recipe, error
@@ -0,0 +1,10 @@
+from django import template
+
+from cuisine.images import get_thumbnail_urls
+
+register = template.Library()
+
+
+@register.simple_tag
+def dish_thumbnails(image, size):
+    return get_thumbnail_urls(image, size)
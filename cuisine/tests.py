@@ -1,3 +1,413 @@
-from django.test import TestCase
+import datetime
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from cuisine import ingredient_index, ingredient_matrix
+from cuisine.benchmarks.fixtures import build_catalog, build_recipe_page, build_users_with_meals
+from cuisine.benchmarks.suites import SUITES, read_quantities_corpus
+from cuisine.dish_pool import fetch_dishes, get_dish_pool
+from cuisine.ingredient_index import load_ingredient_index
+from cuisine.management.commands.recipes import fill_recipes_file, read_checkpoint, read_recipes, record_recipe
+from cuisine.models import Dish, Ingredient, IngredientPosition, Meal, MealPosition
+from cuisine.planner import MenuPlanner, get_dish_catalog
+from cuisine.quantities import parse_quantities
+from cuisine.search import DishSearchResults
+from cuisine.services import (
+    aggregate_ingredients,
+    aggregate_ingredients_from_matrix,
+    aggregate_ingredients_from_summaries,
+    aggregate_ingredients_in_db,
+    fill_missing_meals,
+    generate_daily_menu_randomly,
+    generate_dates_from_today,
+    get_week_menu,
+)
+from cuisine.signals import reset_catalog_caches
+from cuisine.snapshots import SnapshotStore
+
+# the default file cache is shared with running servers, the tests get their own one in memory
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'}}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CatalogTestCase(TestCase):
+    def setUp(self):
+        # the database is rolled back after every test, while the catalog caches outlive it
+        cache.clear()
+        reset_catalog_caches()
+        self.dish_ids = build_catalog(dishes_count=60, ingredients_count=40, ingredients_per_dish=6)
+
+
+class FillMissingMealsTest(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='eater')
+        self.dates = generate_dates_from_today(days_count=7)
+
+    def test_fills_every_slot_once(self):
+        self.assertEqual(fill_missing_meals([self.user.id], self.dates), 21)
+        self.assertEqual(fill_missing_meals([self.user.id], self.dates), 0)
+
+        self.assertEqual(Meal.objects.filter(customer=self.user).count(), 21)
+        self.assertEqual(MealPosition.objects.filter(meal__customer=self.user).count(), 21)
+
+    def test_fills_only_missing_slots(self):
+        fill_missing_meals([self.user.id], self.dates)
+        Meal.objects.filter(customer=self.user, date=self.dates[0]).delete()
+
+        self.assertEqual(fill_missing_meals([self.user.id], self.dates), 3)
+        self.assertEqual(MealPosition.objects.filter(meal__customer=self.user).count(), 21)
+
+    def test_planner_fills_every_slot_once(self):
+        planner = MenuPlanner(get_dish_catalog(), no_repeat_days=3, randomizer=random.Random(0))
+
+        self.assertEqual(fill_missing_meals([self.user.id], self.dates, planner=planner), 21)
+        self.assertEqual(fill_missing_meals([self.user.id], self.dates, planner=planner), 0)
+        self.assertEqual(MealPosition.objects.filter(meal__customer=self.user).count(), 21)
+
+
+class AggregateIngredientsTest(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, = build_users_with_meals(users_count=1, weeks_count=1, dish_ids=self.dish_ids)
+        self.weekdays = [datetime.date.today() - datetime.timedelta(days=day) for day in range(1, 8)]
+
+    def assertSameIngredients(self, ingredients, expected_ingredients):
+        ingredients = {ingredient['name']: ingredient for ingredient in ingredients}
+        expected_ingredients = {ingredient['name']: ingredient for ingredient in expected_ingredients}
+        self.assertEqual(ingredients.keys(), expected_ingredients.keys())
+        for name, expected_ingredient in expected_ingredients.items():
+            with self.subTest(ingredient=name):
+                self.assertEqual(ingredients[name]['units_name'], expected_ingredient['units_name'])
+                self.assertAlmostEqual(ingredients[name]['total_quantity'], expected_ingredient['total_quantity'])
+                self.assertAlmostEqual(ingredients[name]['total_price'], expected_ingredient['total_price'])
+
+    def test_summaries_match_python_fallback(self):
+        expected_ingredients = aggregate_ingredients(self.user, self.weekdays)
+        self.assertTrue(expected_ingredients)
+        self.assertSameIngredients(aggregate_ingredients_from_summaries(self.user, self.weekdays), expected_ingredients)
+
+    def test_db_aggregation_matches_python_fallback(self):
+        expected_ingredients = aggregate_ingredients(self.user, self.weekdays)
+        self.assertSameIngredients(aggregate_ingredients_in_db(self.user, self.weekdays), expected_ingredients)
+
+    def test_matrix_matches_python_fallback(self):
+        expected_ingredients = aggregate_ingredients(self.user, self.weekdays)
+        self.assertSameIngredients(aggregate_ingredients_from_matrix(self.user, self.weekdays), expected_ingredients)
+
+    def test_matrix_falls_back_to_summaries_without_numpy(self):
+        expected_ingredients = aggregate_ingredients(self.user, self.weekdays)
+        with mock.patch.object(ingredient_matrix, 'numpy', None):
+            ingredients = aggregate_ingredients_from_matrix(self.user, self.weekdays)
+        self.assertSameIngredients(ingredients, expected_ingredients)
+
+
+class WeekMenuCacheTest(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='eater')
+
+    def get_dish_names(self):
+        return [meal['name'] for _, meals in get_week_menu(self.user) for meal in meals]
+
+    def test_reuses_cached_menu(self):
+        dish_names = self.get_dish_names()
+        self.assertEqual(len(dish_names), 21)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_dish_names(), dish_names)
+
+    def test_meal_change_resets_cached_menu(self):
+        self.get_dish_names()
+        meal_position = MealPosition.objects.filter(meal__customer=self.user).order_by('meal__date', 'id').first()
+        menu_dish_ids = MealPosition.objects.filter(meal__customer=self.user).values('dish_id')
+        new_dish = Dish.objects.exclude(id__in=menu_dish_ids).first()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            meal_position.dish = new_dish
+            meal_position.save()
+
+        self.assertIn(new_dish.name, self.get_dish_names())
+
+    def test_meal_deletion_resets_cached_menu(self):
+        self.get_dish_names()
+        with self.captureOnCommitCallbacks(execute=True):
+            Meal.objects.filter(customer=self.user, date=datetime.date.today()).delete()
+
+        # the deleted meals are planned again instead of being served from the cache
+        self.assertEqual(len(self.get_dish_names()), 21)
+        self.assertEqual(Meal.objects.filter(customer=self.user, date=datetime.date.today()).count(), 3)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class DishSearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_catalog_caches()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.beet = Ingredient.objects.create(name='Свекла', price=50, units='г')
+            self.borsch = self.create_dish('Борщ', 'Сварить бульон.', self.beet)
+            self.salad = self.create_dish('Винегрет', 'Нарезать овощи, как для борща.', self.beet)
+
+    def create_dish(self, name, recipe, ingredient):
+        dish = Dish.objects.create(name=name, recipe=recipe)
+        IngredientPosition.objects.create(dish=dish, ingredient=ingredient, quantity=200)
+        return dish
+
+    def search(self, query):
+        return [dish.name for dish in DishSearchResults(query)[0:10]]
+
+    def test_ranks_name_matches_first(self):
+        # the last word is a prefix, so the recipe's "борща" matches too, below the name
+        self.assertEqual(self.search('борщ'), ['Борщ', 'Винегрет'])
+        self.assertEqual(self.search('сварить бульон'), ['Борщ'])
+        self.assertEqual(self.search('свекла'), ['Борщ', 'Винегрет'])
+        self.assertEqual(len(DishSearchResults('бор')), 2)
+        self.assertEqual(self.search('!!'), [])
+
+    def test_index_follows_catalog_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.salad.name = 'Салат'
+            self.salad.save()
+            self.beet.name = 'Буряк'
+            self.beet.save()
+            self.borsch.delete()
+
+        self.assertEqual(self.search('винегрет'), [])
+        self.assertEqual(self.search('салат'), ['Салат'])
+        self.assertEqual(self.search('свекла'), [])
+        self.assertEqual(self.search('буряк'), ['Салат'])
+        self.assertEqual(self.search('бульон'), [])
+
+
+class IngredientIndexTest(CatalogTestCase):
+    @skipIf(ingredient_index.numpy is None, 'numpy is not installed')
+    def test_numpy_ranking_matches_pure_python(self):
+        index = load_ingredient_index()
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        randomizer = random.Random(0)
+        for pantry_size in (1, 3, 10, 40):
+            pantry = randomizer.sample(ingredient_ids, k=pantry_size)
+            with self.subTest(pantry_size=pantry_size):
+                dishes = index.find_dishes(pantry, limit=20)
+                with mock.patch.object(ingredient_index, 'numpy', None):
+                    self.assertEqual(index.find_dishes(pantry, limit=20), dishes)
+                self.assertTrue(dishes)
+
+    def test_finds_fully_covered_dishes_first(self):
+        dish = Dish.objects.get(id=self.dish_ids[0])
+        pantry = list(dish.positions.values_list('ingredient_id', flat=True))
+
+        dish_coverage, *_ = load_ingredient_index().find_dishes(pantry, limit=5)
+        self.assertEqual(dish_coverage.coverage, 1)
+        self.assertEqual(dish_coverage.positions_count, len(pantry))
+
+
+class DishPoolTest(CatalogTestCase):
+    def delete_breakfasts_but_one(self):
+        # the pool is loaded before the deletion, whose on_commit reset never runs in the test transaction,
+        # like a dish deleted in another process that hasn't bumped the revision yet
+        get_dish_pool('завтрак')
+        breakfasts = Dish.objects.filter(tags__name='завтрак').order_by('id')
+        kept_breakfast = breakfasts.first()
+        Dish.objects.filter(id__in=breakfasts.exclude(id=kept_breakfast.id).values('id')).delete()
+        return kept_breakfast
+
+    def test_fetch_dishes_keeps_deleted_dishes_in_place(self):
+        kept_breakfast = self.delete_breakfasts_but_one()
+        deleted_dish_id = get_dish_pool('завтрак')[-1]
+
+        self.assertEqual(fetch_dishes([deleted_dish_id, kept_breakfast.id]), [None, kept_breakfast])
+
+    def test_daily_menu_skips_dishes_deleted_from_cached_pool(self):
+        kept_breakfast = self.delete_breakfasts_but_one()
+
+        for _ in range(5):
+            menu = generate_daily_menu_randomly()
+            self.assertEqual(menu['breakfast'], kept_breakfast)
+            self.assertIsNotNone(menu['lunch'])
+            self.assertIsNotNone(menu['dinner'])
+
+
+class ParseQuantitiesTest(SimpleTestCase):
+    def test_quantities_corpus(self):
+        for quantity_with_units, portions, quantity, units in read_quantities_corpus():
+            with self.subTest(quantity_with_units=quantity_with_units):
+                self.assertEqual(parse_quantities([quantity_with_units], portions), [(quantity, units)])
+
+    def test_rejects_pages_without_portions(self):
+        with self.assertRaises(ValueError):
+            parse_quantities(['300 г'], 0)
+
+
+class SavedPagesHandler(SimpleHTTPRequestHandler):
+    requested_paths = []
+    failing_paths = set()
+
+    def do_GET(self):
+        self.requested_paths.append(self.path)
+        if self.path in self.failing_paths:
+            self.send_error(503)
+            return
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FillRecipesFileTest(SimpleTestCase):
+    """Парсинг страниц, сохраненных в каталог и отданных локальным http.server."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+        pages_directory = os.path.join(self.directory, 'recepty')
+        os.mkdir(pages_directory)
+        randomizer = random.Random(0)
+        # page 4 is missing and page 6 answers 503, the rest are recipes
+        for number in (1, 2, 3, 5, 6):
+            with open(os.path.join(pages_directory, f'{number}.html'), 'w', encoding='utf-8') as file:
+                file.write(build_recipe_page(number, randomizer))
+
+        SavedPagesHandler.requested_paths = []
+        SavedPagesHandler.failing_paths = {'/recepty/6.html'}
+        server = ThreadingHTTPServer(
+            ('127.0.0.1', 0),
+            lambda *args, **kwargs: SavedPagesHandler(*args, directory=self.directory, **kwargs),
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        self.url_template = f'http://127.0.0.1:{server.server_address[1]}/recepty/{{number}}.html'
+        self.recipes_path = os.path.join(self.directory, 'recipes.jsonl')
+        self.checkpoint_path = os.path.join(self.directory, 'recipes.checkpoint')
+        self.snapshots_directory = os.path.join(self.directory, 'snapshots')
+
+    def fill_recipes_file(self, numbers):
+        return fill_recipes_file(
+            recipes_path=self.recipes_path,
+            url_template=self.url_template,
+            numbers=numbers,
+            workers=2,
+            rate=0,
+            retries=0,
+            checkpoint_path=self.checkpoint_path,
+            snapshots_directory=self.snapshots_directory,
+            log=lambda message: None,
+        )
+
+    def test_writes_recipes_as_jsonl(self):
+        self.assertEqual(self.fill_recipes_file(range(1, 3)), 2)
+
+        recipes = sorted(read_recipes(self.recipes_path), key=lambda recipe: recipe['name'])
+        self.assertEqual([recipe['name'] for recipe in recipes], ['Блюдо 1', 'Блюдо 2'])
+        for recipe in recipes:
+            self.assertEqual(len(recipe['ingredients_and_quantity']), 8)
+            self.assertTrue(recipe['image'].startswith('https://eda.ru/img/'))
+            self.assertEqual(recipe['tags'], ['Супы', 'обед'])
+        self.assertEqual(len(SnapshotStore(self.snapshots_directory)), 2)
+
+    def test_resumes_from_checkpoint(self):
+        self.fill_recipes_file(range(1, 3))
+        # an interrupted run may leave a cut off line behind
+        with open(self.recipes_path, 'a', encoding='utf-8') as recipes_file:
+            recipes_file.write('{"name": "Блюдо')
+        SavedPagesHandler.requested_paths = []
+
+        self.assertEqual(self.fill_recipes_file(range(1, 7)), 2)
+
+        self.assertEqual(
+            sorted(SavedPagesHandler.requested_paths),
+            ['/recepty/3.html', '/recepty/4.html', '/recepty/5.html', '/recepty/6.html'],
+        )
+        self.assertEqual(
+            sorted(recipe['name'] for recipe in read_recipes(self.recipes_path)),
+            ['Блюдо 1', 'Блюдо 2', 'Блюдо 3', 'Блюдо 5'],
+        )
+
+    def test_skips_missing_pages_and_retries_failed_ones(self):
+        self.fill_recipes_file(range(3, 7))
+
+        # a missing page is done for good, a failed one is fetched again on the next run
+        self.assertEqual(read_checkpoint(self.checkpoint_path), {3, 4, 5})
+        SavedPagesHandler.requested_paths = []
+        SavedPagesHandler.failing_paths = set()
+
+        self.assertEqual(self.fill_recipes_file(range(3, 7)), 1)
+        self.assertEqual(SavedPagesHandler.requested_paths, ['/recepty/6.html'])
+        self.assertEqual(read_checkpoint(self.checkpoint_path), {3, 4, 5, 6})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecordRecipeTest(TestCase):
+    def setUp(self):
+        Ingredient.objects.create(name='Свекла', price=50, units='г')
+        Ingredient.objects.create(name='Соль', price=20, units='г')
+        self.recipe = {
+            'name': 'Борщ',
+            'image': 'https://eda.ru/img/1.jpg',
+            'cooking_time': '90 минут',
+            'recipe': 'Сварить бульон.\nДобавить свеклу.',
+            'tags': ['Супы', 'обед'],
+            'ingredients_and_quantity': {'Свекла': ['200.000', 'г'], 'Соль': ['0.000', 'по вкусу']},
+        }
+
+    def test_records_dish_with_recipe_text(self):
+        dish = record_recipe(self.recipe)
+
+        dish = Dish.objects.get(id=dish.id)
+        self.assertEqual(dish.cooking_time, '90 минут')
+        self.assertEqual(dish.recipe, 'Сварить бульон.\nДобавить свеклу.')
+        self.assertEqual(sorted(dish.tags.values_list('name', flat=True)), ['Супы', 'обед'])
+        self.assertEqual(
+            sorted(dish.positions.values_list('ingredient__name', 'quantity')),
+            [('Свекла', 200.0), ('Соль', 0.0)],
+        )
+
+    def test_fills_text_of_existing_dish(self):
+        Dish.objects.create(name='Борщ', recipe='')
+
+        self.assertIsNone(record_recipe(self.recipe))
+        dish = Dish.objects.get(name='Борщ')
+        self.assertEqual(dish.cooking_time, '90 минут')
+        self.assertEqual(dish.recipe, 'Сварить бульон.\nДобавить свеклу.')
+        self.assertFalse(dish.positions.exists())
+
+    def test_skips_recipe_with_unknown_ingredient(self):
+        self.recipe['ingredients_and_quantity']['Укроп'] = ['10.000', 'г']
+
+        self.assertIsNone(record_recipe(self.recipe))
+        self.assertFalse(Dish.objects.exists())
+
+
+class BenchmarkCommandTest(SimpleTestCase):
+    def test_runs_all_suites(self):
+        # the command sets up its own database and test environment, so it runs in a process of its own
+        completed = subprocess.run(
+            [
+                sys.executable, 'manage.py', 'benchmark', '--dishes', '60', '--ingredients', '40', '--users', '4',
+                '--weeks', '1', '--repeat', '1', '--requests', '2', '--pages', '2',
+            ],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            timeout=600,
+        )
+
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+        for suite in SUITES:
+            self.assertIn(f'Suite {suite}\n', completed.stdout)
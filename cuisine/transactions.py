@@ -0,0 +1,25 @@
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+@contextmanager
+def write_transaction(using=None):
+    """transaction.atomic() для блоков, которые пишут в базу.
+
+    На SQLite внешний такой блок открывается как BEGIN SQLITE_TRANSACTION_MODE и сразу берет блокировку записи,
+    остальные транзакции остаются отложенными и не мешают чтению.
+    """
+    connection = transaction.get_connection(using)
+    if not hasattr(connection, 'immediate_transaction') or connection.in_atomic_block:
+        # an outer block has already chosen how the transaction begins
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    connection.immediate_transaction = True
+    try:
+        with transaction.atomic(using=using):
+            yield
+    finally:
+        connection.immediate_transaction = False
@@ -6,23 +6,25 @@ from django.template.context_processors import csrf
 from django.http import HttpResponseRedirect
 from django.shortcuts import render, get_object_or_404, redirect
 
+from cuisine.dish_pool import choose_dishes, get_dish_pool
 from cuisine.models import Meal, Dish, MealPosition
 from cuisine.forms import DaysForm, LoginForm
 from django.urls import reverse
 from django.http import HttpResponse
 from django.contrib.auth import authenticate, login
 from cuisine.forms import UserRegistrationForm
+from cuisine.services import aggregate_ingredients_from_matrix
 
 TEMPLATE = os.getenv('TEMPLATE', 'oganik')
 MEAL_TYPE_RU_TO_EN = {'завтрак': 'breakfast', 'обед': 'lunch', 'ужин': 'dinner'}
 
 
 def get_random_menu():
-    dishes = Dish.objects.prefetch_related('tags')
+    breakfast, lunch, dinner = choose_dishes(['завтрак', 'обед', 'ужин'])
     random_menu = {
-        'breakfast': random.choice(dishes.filter(tags__name='завтрак')),
-        'lunch': random.choice(dishes.filter(tags__name='обед')),
-        'dinner': random.choice(dishes.filter(tags__name='ужин')),
+        'breakfast': breakfast,
+        'lunch': lunch,
+        'dinner': dinner,
     }
     return random_menu
 
@@ -47,62 +49,59 @@ def daily_menu(user):
     return context
 
 
-def generate_next_week_menu(user):
-    dishes = Dish.objects.prefetch_related('tags')
-
-    local_dishes = {
-        'breakfast': list(dishes.filter(tags__name='завтрак')),
-        'lunch': list(dishes.filter(tags__name='обед')),
-        'dinner': list(dishes.filter(tags__name='ужин')),
+def get_local_dish_ids():
+    return {
+        'breakfast': list(get_dish_pool('завтрак')),
+        'lunch': list(get_dish_pool('обед')),
+        'dinner': list(get_dish_pool('ужин')),
     }
 
-    for index, meal_type in enumerate(local_dishes):
+
+def generate_next_week_menu(user):
+    local_dish_ids = get_local_dish_ids()
+
+    for index, meal_type in enumerate(local_dish_ids):
         first_day_meal = Meal.objects.create(
             meal_type=meal_type.upper(),
             date=datetime.datetime.today(),
             customer=user)
         MealPosition.objects.create(
             meal=first_day_meal,
-            dish=dishes.get(id=saved_random_menu[index]),
+            dish_id=saved_random_menu[index],
             quantity=1)
-    for index, dish in enumerate(local_dishes):
-        local_dishes[dish].remove(dishes.get(id=saved_random_menu[index]))
+    for index, meal_type in enumerate(local_dish_ids):
+        local_dish_ids[meal_type].remove(saved_random_menu[index])
 
     first_date = datetime.datetime.today() + datetime.timedelta(days=1)
     for day in range(6):
         date = first_date + datetime.timedelta(days=day)
-        for meal_type in local_dishes:
+        for meal_type in local_dish_ids:
             meal = Meal.objects.create(
                 meal_type=meal_type.upper(),
                 date=date,
                 customer=user)
-            dish = local_dishes[meal_type].pop(random.choice(range(len(local_dishes[meal_type]))))
+            dish_id = local_dish_ids[meal_type].pop(random.choice(range(len(local_dish_ids[meal_type]))))
             MealPosition.objects.create(
                 meal=meal,
-                dish=dish,
+                dish_id=dish_id,
                 quantity=1)
 
 
 def generate_last_day_week_menu(user, needed_generated_menu_days):
-    dishes = Dish.objects.prefetch_related('tags')
+    local_dish_ids = get_local_dish_ids()
 
-    local_dishes = {
-        'breakfast': list(dishes.filter(tags__name='завтрак')),
-        'lunch': list(dishes.filter(tags__name='обед')),
-        'dinner': list(dishes.filter(tags__name='ужин')),
-    }
     first_date = datetime.datetime.today() + datetime.timedelta(days=needed_generated_menu_days + 1)
     for day in range(7 - needed_generated_menu_days):
         date = first_date + datetime.timedelta(days=day)
-        for meal_type in local_dishes:
+        for meal_type in local_dish_ids:
             meal = Meal.objects.create(
                 meal_type=meal_type.upper(),
                 date=date,
                 customer=user)
-            dish = local_dishes[meal_type].pop(random.choice(range(len(local_dishes[meal_type]))))
+            dish_id = local_dish_ids[meal_type].pop(random.choice(range(len(local_dish_ids[meal_type]))))
             MealPosition.objects.create(
                 meal=meal,
-                dish=dish,
+                dish_id=dish_id,
                 quantity=1)
 
 
@@ -146,29 +145,17 @@ def calculate_products(request):
         days_to_calculate = int(request.POST.get('days', 0))
         weekdays = count_days(days_to_calculate)
 
-        ingredients = (
-            Meal.objects
-            .filter(date__in=weekdays, customer=request.user)
-            .values_list(
-                'meal_positions__dish__positions__ingredient__name',
-                'meal_positions__dish__positions__quantity',
-                'meal_positions__dish__positions__ingredient__units',
-                'meal_positions__dish__positions__ingredient__price',
-            )
-        )
+        ingredients = aggregate_ingredients_from_matrix(request.user, weekdays)
 
         total_ingredients = {}
         total_sum = 0
-        for ingredient, quantity, units, price in ingredients:
-            if price is None:
-                price = 0
-            total_ingredients.setdefault(ingredient, [0, units, 0])
-            total_ingredients[ingredient][0] += float(f'{quantity:.2f}')
-            ingredient_price = quantity * int(price)
-            if units == 'г' or units == 'мл':
-                ingredient_price = quantity * int(price) / 1000
-            total_ingredients[ingredient][2] += float(f'{ingredient_price:.2f}')
-            total_sum += ingredient_price
+        for ingredient in ingredients:
+            total_ingredients[ingredient['name']] = [
+                float(f"{ingredient['total_quantity']:.2f}"),
+                ingredient['units_name'],
+                float(f"{ingredient['total_price']:.2f}"),
+            ]
+            total_sum += ingredient['total_price']
 
         context = {
             'ingredients': total_ingredients, 'form': form,
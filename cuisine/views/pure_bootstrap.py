@@ -1,54 +1,43 @@
 import logging
 import os
-from collections import defaultdict
 
 from django.contrib.auth import authenticate, login
+from django.core.cache import cache
+from django.core.paginator import Paginator
 from django.http import HttpResponse, HttpRequest
 from django.shortcuts import render, get_object_or_404, redirect
 from django.template.context_processors import csrf
 
-from cuisine.models import Meal, Dish
-from cuisine.forms import DaysForm, LoginForm, UserRegistrationForm
+from cuisine.caching import CATALOG_CACHE_TIMEOUT, get_catalog_cache_key, get_catalog_revision
+from cuisine.dish_pool import fetch_dishes
+from cuisine.ingredient_index import get_ingredient_index
+from cuisine.models import Dish
+from cuisine.search import DishSearchResults
+from cuisine.forms import DaysForm, LoginForm, PantryForm, UserRegistrationForm
 from cuisine.services import (
     generate_dates_from_today,
     generate_daily_menu_randomly,
-    regenerate_and_save_menu,
-    aggregate_ingredients,
+    get_week_menu,
+    aggregate_ingredients_from_matrix,
 )
 
 TEMPLATE = os.getenv('TEMPLATE', 'pure_bootstrap')
+SEARCH_PAGE_SIZE = 24
+PANTRY_DISHES_COUNT = 24
 logger = logging.getLogger(__name__)
 
 
 def index_page(request: HttpRequest) -> HttpResponse:
     if not request.user.is_authenticated:
         context = generate_daily_menu_randomly()
+        context['catalog_revision'] = get_catalog_revision()
         return render(request, f'{TEMPLATE}/index.html', context)
     else:
         return redirect('week_menu')
 
 
 def show_next_week_menu(request: HttpRequest) -> HttpResponse:
-    regenerate_and_save_menu(request.user)
-
-    weekdays = generate_dates_from_today(days_count=7)
-    meals = (
-        Meal.objects
-        .select_related('customer')
-        .filter(date__in=weekdays, customer=request.user)
-        .order_by('date')
-        .prefetch_related('meal_positions__dish')
-    )
-
-    serialized_meals = defaultdict(list)
-    for meal in meals:
-        dish = meal.meal_positions.first().dish
-        serialized_meal = {
-            'id': dish.id, 'name': dish.name, 'image_url': dish.image.url, 'meal_type': meal.get_meal_type_display(),
-        }
-        serialized_meals[meal.date].append(serialized_meal)
-
-    return render(request, f'{TEMPLATE}/week_menu.html', context={'meals': serialized_meals.items()})
+    return render(request, f'{TEMPLATE}/week_menu.html', context={'meals': get_week_menu(request.user)})
 
 
 def calculate_products(request: HttpRequest) -> HttpResponse:
@@ -58,7 +47,7 @@ def calculate_products(request: HttpRequest) -> HttpResponse:
             return render(request, f'{TEMPLATE}/calculator.html')
 
         weekdays = generate_dates_from_today(days_count=int(request.POST.get('days', 0)))
-        aggregated_ingredients = aggregate_ingredients(request.user, weekdays)
+        aggregated_ingredients = aggregate_ingredients_from_matrix(request.user, weekdays)
 
         context = {
             'ingredients': aggregated_ingredients,
@@ -77,8 +66,49 @@ def calculate_products(request: HttpRequest) -> HttpResponse:
 
 
 def view_recipe(request: HttpRequest, recipe_id: int) -> HttpResponse:
-    dish = get_object_or_404(Dish, pk=recipe_id)
-    return render(request, f'{TEMPLATE}/recipe.html', context={'recipe': dish})
+    # the header differs for authenticated users, so they get their own copy of the page
+    cache_key = get_catalog_cache_key('recipe', recipe_id, request.user.is_authenticated)
+    if page := cache.get(cache_key):
+        return HttpResponse(page)
+
+    dish = get_object_or_404(Dish.objects.prefetch_related('positions__ingredient'), pk=recipe_id)
+    response = render(request, f'{TEMPLATE}/recipe.html', context={'recipe': dish})
+    cache.set(cache_key, response.content, timeout=CATALOG_CACHE_TIMEOUT)
+    return response
+
+
+def search_recipes(request: HttpRequest) -> HttpResponse:
+    query = request.GET.get('q', '').strip()
+    page = Paginator(DishSearchResults(query), SEARCH_PAGE_SIZE).get_page(request.GET.get('page'))
+    context = {
+        'query': query,
+        'page': page,
+        'catalog_revision': get_catalog_revision(),
+    }
+    return render(request, f'{TEMPLATE}/search.html', context)
+
+
+def find_cookable_dishes(request: HttpRequest) -> HttpResponse:
+    form = PantryForm(request.GET or None)
+    selected_ingredients = []
+    dishes = []
+    if form.is_valid():
+        selected_ingredients = form.cleaned_data['ingredients']
+        ingredient_ids = [ingredient.id for ingredient in selected_ingredients]
+        coverages = get_ingredient_index().find_dishes(ingredient_ids, limit=PANTRY_DISHES_COUNT)
+        dishes = [
+            (dish, coverage)
+            for dish, coverage in zip(fetch_dishes([coverage.dish_id for coverage in coverages]), coverages)
+            if dish is not None
+        ]
+    context = {
+        'form': form,
+        'ingredients': form.fields['ingredients'].queryset.values_list('id', 'name'),
+        'selected_ingredients': selected_ingredients,
+        'dishes': dishes,
+        'catalog_revision': get_catalog_revision(),
+    }
+    return render(request, f'{TEMPLATE}/pantry.html', context)
 
 
 def register(request: HttpRequest) -> HttpResponse:
@@ -0,0 +1,49 @@
+from django.core.cache import cache
+from django.http import HttpResponse, HttpRequest
+from django.shortcuts import render, get_object_or_404, redirect
+
+from cuisine.asynchronous import run_in_thread_pool
+from cuisine.caching import CATALOG_CACHE_TIMEOUT, get_catalog_cache_key, get_catalog_revision
+from cuisine.models import Dish
+from cuisine.services import generate_daily_menu_randomly, get_week_menu
+from cuisine.views.pure_bootstrap import (  # noqa: F401
+    TEMPLATE,
+    calculate_products,
+    find_cookable_dishes,
+    register,
+    search_recipes,
+)
+
+
+def is_authenticated(request: HttpRequest) -> bool:
+    # the user is loaded lazily from the session, which needs the database
+    return request.user.is_authenticated
+
+
+async def index_page(request: HttpRequest) -> HttpResponse:
+    if await run_in_thread_pool(is_authenticated, request):
+        return redirect('week_menu')
+
+    context = await run_in_thread_pool(generate_daily_menu_randomly)
+    context['catalog_revision'] = await run_in_thread_pool(get_catalog_revision)
+    return await run_in_thread_pool(render, request, f'{TEMPLATE}/index.html', context)
+
+
+async def show_next_week_menu(request: HttpRequest) -> HttpResponse:
+    meals = await run_in_thread_pool(get_week_menu, request.user)
+    return await run_in_thread_pool(render, request, f'{TEMPLATE}/week_menu.html', context={'meals': meals})
+
+
+async def view_recipe(request: HttpRequest, recipe_id: int) -> HttpResponse:
+    # the header differs for authenticated users, so they get their own copy of the page
+    user_is_authenticated = await run_in_thread_pool(is_authenticated, request)
+    cache_key = await run_in_thread_pool(get_catalog_cache_key, 'recipe', recipe_id, user_is_authenticated)
+    if page := await run_in_thread_pool(cache.get, cache_key):
+        return HttpResponse(page)
+
+    dish = await run_in_thread_pool(
+        get_object_or_404, Dish.objects.prefetch_related('positions__ingredient'), pk=recipe_id,
+    )
+    response = await run_in_thread_pool(render, request, f'{TEMPLATE}/recipe.html', context={'recipe': dish})
+    await run_in_thread_pool(cache.set, cache_key, response.content, timeout=CATALOG_CACHE_TIMEOUT)
+    return response
@@ -3,6 +3,7 @@ import os
 from pathlib import Path
 
 from environs import Env
+from django.core.exceptions import ImproperlyConfigured
 from django.urls import reverse_lazy
 
 
@@ -44,12 +45,12 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'debug_toolbar',
     'cuisine',
     'django.contrib.admin',
 ]
 
 MIDDLEWARE = [
+    'cuisine.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,9 +58,13 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+DEBUG_TOOLBAR = env.bool('DEBUG_TOOLBAR', DEBUG)
+if DEBUG_TOOLBAR:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 # LOGIN_URL = 'login/'
 PUBLIC_PATHS = ['^/admin/.*', '/logout', '/login', '/register']
 
@@ -67,7 +72,7 @@ ROOT_URLCONF = 'foodplan.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'cuisine.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -97,14 +102,59 @@ LOGGING = {
 
 WSGI_APPLICATION = 'foodplan.wsgi.application'
 
+# Under ASGI the read-only views are served by async versions, which run ORM and template work
+# in a thread pool of ASYNC_THREADS threads
+ASYNC_VIEWS = env.bool('ASYNC_VIEWS', False)
+ASYNC_THREADS = env.int('ASYNC_THREADS', 8)
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
-DATABASES = {
+DATABASE_PROFILE = env.str('DATABASE_PROFILE', 'sqlite')
+
+if DATABASE_PROFILE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'cuisine.backends.sqlite3',
+            'NAME': env.str('SQLITE_PATH', str(BASE_DIR / 'db.sqlite3')),
+            'CONN_MAX_AGE': env.int('DATABASE_CONN_MAX_AGE', 60),
+        }
+    }
+elif DATABASE_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': env.str('POSTGRES_DB', 'foodplan'),
+            'USER': env.str('POSTGRES_USER', 'foodplan'),
+            'PASSWORD': env.str('POSTGRES_PASSWORD', ''),
+            'HOST': env.str('POSTGRES_HOST', 'localhost'),
+            'PORT': env.int('POSTGRES_PORT', 5432),
+            'CONN_MAX_AGE': env.int('DATABASE_CONN_MAX_AGE', 600),
+            # PgBouncer in transaction mode doesn't keep server-side cursors between transactions
+            'DISABLE_SERVER_SIDE_CURSORS': env.bool('POSTGRES_PGBOUNCER', False),
+        }
+    }
+else:
+    raise ImproperlyConfigured(f'Unknown DATABASE_PROFILE: {DATABASE_PROFILE}')
+
+# Applied to every new SQLite connection by cuisine.signals
+SQLITE_PRAGMAS = {
+    'journal_mode': env.str('SQLITE_JOURNAL_MODE', 'wal'),
+    'synchronous': env.str('SQLITE_SYNCHRONOUS', 'normal'),
+    'busy_timeout': env.int('SQLITE_BUSY_TIMEOUT', 5000),
+}
+SQLITE_TRANSACTION_MODE = env.str('SQLITE_TRANSACTION_MODE', 'IMMEDIATE')
+
+# The catalog revision and the cached pages have to be shared by all worker processes, so the default backend
+# is a directory on disk. Memcached fits as well, while LocMemCache is only good for a single process
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': env.str('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': env.str('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': env.int('CACHE_MAX_ENTRIES', 10000),
+        },
     }
 }
 
@@ -15,7 +15,6 @@ Including another URLconf
 """
 import os
 
-import debug_toolbar
 from django.conf.urls import url
 
 from django.contrib import admin
@@ -24,9 +23,14 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth.views import LoginView, LogoutView
 
+from cuisine.exports import export_shopping_lists
+from cuisine.instrumentation import show_metrics
+
 TEMPLATE = os.getenv('TEMPLATE', 'pure_bootstrap')
 
-if TEMPLATE == 'pure_bootstrap':
+if TEMPLATE == 'pure_bootstrap' and settings.ASYNC_VIEWS:
+    from cuisine.views import pure_bootstrap_async as views
+elif TEMPLATE == 'pure_bootstrap':
     from cuisine.views import pure_bootstrap as views
 elif TEMPLATE == 'oganik':
     from cuisine.views import oganik as views
@@ -38,11 +42,24 @@ urlpatterns = [
     path('week_menu/', views.show_next_week_menu, name='week_menu'),
     path('calculator/', views.calculate_products, name='calculator'),
     path('recipe/<int:recipe_id>', views.view_recipe, name='recipe'),
-    path('__debug__/', include(debug_toolbar.urls)),
+    path('metrics', show_metrics, name='metrics'),
+    path('export/shopping_lists', export_shopping_lists, name='shopping_lists_export'),
     url(r'^register/$', views.register, name='register'),
     url(r'^login/$', LoginView.as_view(template_name=f'{TEMPLATE}/login.html'), name='login'),
     url(r'^logout/$', LogoutView.as_view(template_name=f'{TEMPLATE}/logged_out.html'), name='logout'),
 ]
 
+# the oganik theme has no templates for the search and pantry pages
+if TEMPLATE == 'pure_bootstrap':
+    urlpatterns.extend([
+        path('search/', views.search_recipes, name='search'),
+        path('pantry/', views.find_cookable_dishes, name='pantry'),
+    ])
+
+if settings.DEBUG_TOOLBAR:
+    import debug_toolbar
+
+    urlpatterns.append(path('__debug__/', include(debug_toolbar.urls)))
+
 urlpatterns.extend(static(settings.STATIC_URL, document_root=settings.STATIC_ROOT))
 urlpatterns.extend(static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT))